@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:01:29 2026
+
+Command line entry point for the ADORE REDCap tools
+
+    python adore.py inventory your_redcap_file your_oncore_file your_output_folder
+    python adore.py migrate --data_folder your_transfer_folder
+    python adore.py bench your_redcap_file your_oncore_file
+
+Only the standard library is imported here. pandas, usaddress, openpyxl and
+pyarrow are imported by the subcommands that use them, so --help and
+--dry_run return straight away.
+"""
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+import statistics
+import tempfile
+
+# Kept here, rather than imported, so that building the parser stays fast
+output_formats = ['csv', 'csv.gz', 'parquet', 'feather']
+csv_engines = ['c', 'pyarrow']
+
+
+def main(argv=None):
+    """ Parses the arguments and runs the subcommand """
+
+    # Code
+    parser = return_parser()
+    args = parser.parse_args(argv)
+
+    if (args.command is None):
+        parser.print_help()
+        return 1
+
+    return args.function(args)
+
+def return_parser():
+    """ Builds the argument parser """
+
+    # Code
+    parser = argparse.ArgumentParser(
+        prog='adore',
+        description='Tools for the ADORE REDCap project')
+    subparsers = parser.add_subparsers(dest='command')
+
+    # Inventory
+    p = subparsers.add_parser(
+        'inventory',
+        help='count OnCore samples and build the REDCap import')
+    add_inventory_arguments(p)
+    p.add_argument('previous_import_file_string', nargs='?', default=None,
+                   help='earlier redcap_import.csv or REDCap export, '
+                        'writes redcap_import_diff.csv if set')
+    p.add_argument('--fail_fast', action='store_true',
+                   help='stop before matching if validation finds errors')
+    p.add_argument('--history_folder', default=None,
+                   help='add the counts to the history in this folder')
+    p.add_argument('--data_dictionary', default=None,
+                   help='REDCap data dictionary export, the import is '
+                        'checked against it before it is written')
+    p.add_argument('--dry_run', action='store_true',
+                   help='check the arguments and files, then stop')
+    p.set_defaults(function=run_inventory)
+
+    # Migration
+    p = subparsers.add_parser(
+        'migrate',
+        help='build the REDCap import from the legacy exports')
+    p.add_argument('--data_folder', default=None)
+    p.add_argument('--old_data_file_string', default=None)
+    p.add_argument('--consent_data_file_string', default=None)
+    p.add_argument('--replace_values_file_string', default=None)
+    p.add_argument('--new_fields_file_string', default=None)
+    p.add_argument('--import_file_string', default=None)
+    p.add_argument('--csv_engine', default='c', choices=csv_engines)
+    p.add_argument('--fail_fast', action='store_true',
+                   help='stop before the patient loop if validation '
+                        'finds errors')
+    p.add_argument('--codebook_file_string', default=None,
+                   help='json file adding to the dropdown lists')
+    p.add_argument('--data_dictionary_file_string', default=None,
+                   help='REDCap data dictionary export, the import is '
+                        'checked against it before it is written')
+    p.add_argument('--chunk_size', type=int, default=None,
+                   help='write the import every chunk_size patients and '
+                        'keep a checkpoint')
+    p.add_argument('--resume', action='store_true',
+                   help='carry on from the checkpoint of a chunked run')
+    p.set_defaults(function=run_migrate)
+
+    # Benchmark
+    p = subparsers.add_parser(
+        'bench',
+        help='time each stage of the inventory update')
+    add_inventory_arguments(p, output_folder_required=False)
+    p.add_argument('--repeats', type=int, default=3)
+    p.set_defaults(function=run_bench)
+
+    return parser
+
+def add_inventory_arguments(p, output_folder_required=True):
+    """ Adds the arguments shared by inventory and bench """
+
+    # Code
+    p.add_argument('redcap_data_file_string')
+    p.add_argument('oncore_report_file_string')
+    if (output_folder_required):
+        p.add_argument('output_folder')
+    else:
+        p.add_argument('--output_folder', default=None,
+                       help='defaults to a temporary folder')
+    p.add_argument('--output_format', default='csv', choices=output_formats)
+    p.add_argument('--csv_engine', default='c', choices=csv_engines)
+    p.add_argument('--max_workers', type=int, default=4)
+    p.add_argument('--no_of_processes', type=int, default=None,
+                   help='split matching and counting by MRN across this '
+                        'many processes')
+
+def run_inventory(args):
+    """ Runs update_sample_inventory """
+
+    # display
+    print('REDCap data file: %s' % args.redcap_data_file_string)
+    print('OnCore data file: %s' % args.oncore_report_file_string)
+    print('Output folder: %s' % args.output_folder)
+    if not (args.previous_import_file_string is None):
+        print('Previous import file: %s' % args.previous_import_file_string)
+
+    # Check the inputs before loading anything heavy
+    missing = [f for f in [args.redcap_data_file_string,
+                           args.oncore_report_file_string,
+                           args.previous_import_file_string,
+                           args.data_dictionary]
+               if not ((f is None) or os.path.isfile(f))]
+    for f in missing:
+        print('File not found: %s' % f)
+    if (missing):
+        return 1
+
+    if (args.dry_run):
+        print('Dry run, stopping before the update')
+        return 0
+
+    from update_sample_inventory import update_sample_inventory
+
+    update_sample_inventory(args.redcap_data_file_string,
+                            args.oncore_report_file_string,
+                            args.output_folder,
+                            args.previous_import_file_string,
+                            args.output_format,
+                            args.csv_engine,
+                            args.fail_fast,
+                            args.history_folder,
+                            args.max_workers,
+                            no_of_processes=args.no_of_processes,
+                            data_dictionary_file_string=args.data_dictionary)
+
+    return 0
+
+def run_migrate(args):
+    """ Runs create_import_from_orig_data, using the paths set at the top
+        of that file for any that are not given """
+
+    # Code
+    import create_import_from_orig_data as migration
+
+    file_args = ['data_folder', 'old_data_file_string',
+                 'consent_data_file_string', 'replace_values_file_string',
+                 'new_fields_file_string', 'import_file_string']
+    files = dict()
+    for a in file_args:
+        files[a] = getattr(args, a)
+        if (files[a] is None):
+            files[a] = getattr(migration, a)
+
+    # Resuming only makes sense for a chunked run
+    chunk_size = args.chunk_size
+    if (args.resume and (chunk_size is None)):
+        chunk_size = 50
+
+    migration.create_import_from_orig_data(**files,
+                                           csv_engine=args.csv_engine,
+                                           fail_fast=args.fail_fast,
+                                           codebook_file_string=
+                                               args.codebook_file_string,
+                                           chunk_size=chunk_size,
+                                           resume=args.resume,
+                                           data_dictionary_file_string=
+                                               args.data_dictionary_file_string)
+
+    return 0
+
+def run_bench(args):
+    """ Runs the inventory update several times and prints the median
+        time for each stage and for the whole run """
+
+    # Code
+
+    # Time the imports too, they are part of every run
+    start = time.perf_counter()
+    from update_sample_inventory import update_sample_inventory
+    import_seconds = time.perf_counter() - start
+
+    if (args.output_folder is None):
+        output_folder = tempfile.mkdtemp(prefix='adore_bench_')
+    else:
+        output_folder = args.output_folder
+
+    stage_seconds = dict()
+    total_seconds = []
+
+    for i in range(args.repeats):
+        timings = dict()
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            update_sample_inventory(args.redcap_data_file_string,
+                                    args.oncore_report_file_string,
+                                    output_folder,
+                                    output_format=args.output_format,
+                                    csv_engine=args.csv_engine,
+                                    max_workers=args.max_workers,
+                                    timings=timings,
+                                    no_of_processes=args.no_of_processes)
+        total_seconds.append(time.perf_counter() - start)
+        for (k, v) in timings.items():
+            stage_seconds.setdefault(k, []).append(v)
+
+    # display
+    print('Output folder: %s' % output_folder)
+    print('%-24s %10s' % ('stage', 'median s'))
+    print('%-24s %10.3f' % ('imports', import_seconds))
+    for (k, v) in stage_seconds.items():
+        print('%-24s %10.3f' % (k, statistics.median(v)))
+    print('%-24s %10.3f' % ('total (wall)', statistics.median(total_seconds)))
+
+    return 0
+
+############################################################################
+if __name__ == "__main__":
+    sys.exit(main())
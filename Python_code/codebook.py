@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:04:10 2026
+"""
+
+import json
+
+import pandas as pd
+
+
+def return_codebook(data_dicts, substitutions=None):
+    """ Builds a codebook from lists of dropdown labels. Each entry holds
+        'codes' - a dict mapping each label to its 1-based REDCap code
+        'substitutions' - a dict of label prefixes that are replaced
+                          before coding, e.g. 'Caucasian' -> 'White' """
+
+    # Variables
+    if (substitutions is None):
+        substitutions = dict()
+
+    # Code
+    codebook = dict()
+    for (field, labels) in data_dicts.items():
+        codebook[field] = {
+            'codes': {label: (i + 1) for (i, label) in enumerate(labels)},
+            'substitutions': dict(substitutions.get(field, dict()))}
+
+    return codebook
+
+def load_codebook(codebook_file_string, data_dicts, substitutions=None):
+    """ Builds a codebook from the default data_dicts and substitutions,
+        then adds the lists in a json file of the form
+            {"data_dicts": {"field": ["label 1", "label 2"]},
+             "substitutions": {"field": {"prefix": "label"}}}
+        Lists in the file replace the defaults for the same field """
+
+    # Code
+    with open(codebook_file_string, 'r') as f:
+        file_dicts = json.load(f)
+
+    data_dicts = dict(data_dicts)
+    data_dicts.update(file_dicts.get('data_dicts', dict()))
+
+    substitutions = dict(substitutions or dict())
+    substitutions.update(file_dicts.get('substitutions', dict()))
+
+    return return_codebook(data_dicts, substitutions)
+
+def code_yes_no(values):
+    """ Codes a column as 1 for yes, 0 for any other text and blank
+        for missing values """
+
+    # Code
+    text = return_text_values(values)
+
+    codes = (text.str.lower() == 'yes').astype('Int64')
+    codes = codes.where(text.notnull(), pd.NA)
+
+    return codes
+
+def code_dropdown(values, codebook_entry):
+    """ Codes a column of labels with a hash lookup, returns
+        (codes, unknown) where unknown flags the labels that are not in
+        the codebook. These are left blank """
+
+    # Code
+    text = return_text_values(values)
+
+    for (prefix, label) in codebook_entry['substitutions'].items():
+        text = text.mask(text.str.startswith(prefix, na=False), label)
+
+    codes = text.map(codebook_entry['codes']).astype('Int64')
+    unknown = text.notnull() & codes.isnull()
+
+    return (codes, unknown)
+
+def return_unknown_tally(field, values, unknown):
+    """ Counts the unknown labels in a column """
+
+    # Code
+    counts = values[unknown].value_counts()
+
+    d_tally = pd.DataFrame({'field': field,
+                            'label': counts.index,
+                            'count': counts.to_numpy()})
+
+    return d_tally
+
+def return_text_values(values):
+    """ Returns a copy of a column with everything that is not a string
+        set to NaN, as object dtype so the .str methods always work """
+
+    # Code
+    values = values.astype(object)
+
+    return values.where(values.map(type) == str)
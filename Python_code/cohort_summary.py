@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:20:43 2026
+"""
+
+import pandas as pd
+
+# Columns in the cohort summary
+summary_columns = ['enrollment_period', 'sample_type', 'event', 'status',
+                   'no_of_samples', 'no_of_patients']
+
+
+def return_cohort_summary(registry, d_oncore, enrollment_freq='Q'):
+    """ Rolls the matched samples up to the cohort. The specimens are
+        aggregated once, to one row per patient, sample type, event and
+        status, and everything else is summed from that. Returns
+        (d_summary, d_availability) where
+            d_summary - the number of samples and patients for each
+                        enrollment period, sample type, event and status.
+                        'All' rows give the totals over periods and
+                        over events
+            d_availability - one row per record with a flag for each
+                             sample type, True if the patient has at
+                             least one Available sample of that type
+        enrollment_freq sets the periods, 'Q' for quarters, 'Y' for years
+        or 'M' for months, counted from each patient's first visit """
+
+    # Code
+
+    # The only pass over the specimens
+    d = d_oncore[d_oncore['REDCap_patient_found'] &
+                 (d_oncore['ADORE sample type'] != '')]
+    d_patient = d.groupby(['Patient ID', 'ADORE sample type',
+                           'REDCap_visit_type', 'Specimen Status'],
+                          observed=True).size().reset_index(
+                              name='no_of_samples')
+    d_patient.columns = ['demo_uk_mrn', 'sample_type', 'event', 'status',
+                         'no_of_samples']
+
+    # Patients only enroll once, so the periods split them cleanly
+    enrollment_periods = return_enrollment_periods(registry, enrollment_freq)
+    d_patient['enrollment_period'] = \
+        d_patient['demo_uk_mrn'].map(enrollment_periods).fillna('Unknown')
+
+    # Each row is one patient, so counting rows counts patients
+    keys = ['enrollment_period', 'sample_type', 'status']
+    d_event = d_patient.groupby(keys + ['event'], as_index=False).agg(
+        no_of_samples=('no_of_samples', 'sum'),
+        no_of_patients=('demo_uk_mrn', 'size'))
+
+    # A patient can have samples at several events
+    d_any_event = d_patient.groupby(keys, as_index=False).agg(
+        no_of_samples=('no_of_samples', 'sum'),
+        no_of_patients=('demo_uk_mrn', 'nunique'))
+    d_any_event['event'] = 'All'
+
+    d_period = pd.concat([d_event, d_any_event], ignore_index=True)
+
+    d_all = d_period.groupby(['sample_type', 'event', 'status'],
+                             as_index=False)[
+        ['no_of_samples', 'no_of_patients']].sum()
+    d_all['enrollment_period'] = 'All'
+
+    d_summary = pd.concat([d_all, d_period], ignore_index=True)
+    d_summary = d_summary[summary_columns]
+
+    # Flags for each record
+    d_available = d_patient[d_patient['status'] == 'Available']
+    flags = d_available.pivot_table(index='demo_uk_mrn',
+                                    columns='sample_type',
+                                    values='no_of_samples',
+                                    aggfunc='sum', fill_value=0) > 0
+    flags.columns = ['%s_available' % c for c in flags.columns]
+
+    d_availability = pd.DataFrame(
+        {'record_id': registry['record_ids'],
+         'demo_uk_mrn': registry['record_mrns']})
+    d_availability['enrollment_period'] = \
+        d_availability['demo_uk_mrn'].map(enrollment_periods).fillna('Unknown')
+    flags = flags.reindex(d_availability['demo_uk_mrn'], fill_value=False)
+    d_availability = pd.concat(
+        [d_availability, flags.reset_index(drop=True)], axis=1)
+
+    return (d_summary, d_availability)
+
+def return_enrollment_periods(registry, enrollment_freq='Q'):
+    """ Returns a series of MRN: enrollment period, e.g. 2024Q3, from the
+        first sample visit date for each patient """
+
+    # Code
+    first_visits = dict()
+    for (mrn, visits) in registry['visits'].items():
+        if (mrn == 'nan'):
+            continue
+        dates = [visits[e]['visit_date'] for e in registry['sample_events']
+                 if (e in visits)]
+        first_visits[mrn] = pd.Series(dates, dtype='datetime64[ns]').min()
+
+    first_visits = pd.Series(first_visits, dtype='datetime64[ns]')
+    periods = first_visits.dt.to_period(enrollment_freq).astype(str)
+
+    return periods.where(first_visits.notnull(), 'Unknown')
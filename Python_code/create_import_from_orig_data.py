@@ -7,6 +7,9 @@ Created on Mon Dec 23 15:55:22 2024
 
 import os
 import re
+import sys
+import json
+import hashlib
 
 from pathlib import Path
 
@@ -15,6 +18,14 @@ import pandas as pd
 
 import usaddress
 
+from csv_ingest import read_csv_file
+from codebook import return_codebook, load_codebook, code_yes_no, \
+    code_dropdown, return_unknown_tally, return_text_values
+from data_validation import report_columns, return_check, \
+    return_validation_report, check_validation_report
+from data_dictionary import load_field_validators, return_import_text, \
+    validate_import_data
+
 
 # Variables
 data_folder = 'c:/ken/ccts_banking/ADORE//data/transfer'
@@ -48,6 +59,131 @@ data_dicts['additional_studies'] = ['Excel (Tirzepatide)',
                                    'Kern-driven studies',
                                    'Other']
 
+# Legacy columns that are coded for REDCap. Each entry is
+# (import field, legacy column, codebook field or 'yes_no'). Race is
+# a checkbox, so its coded column holds the name of the box to tick
+coded_columns = [
+    ('clin_smoked_before_visit',
+     'Did the subject smoke in the last 12 hours?', 'yes_no'),
+    ('clin_nsaid_before_visit',
+     'Did the subject take Aspirin/NSAIDs in the last 72 hours?', 'yes_no'),
+    ('mh_tobacco_current',
+     'Do you smoke?', 'yes_no'),
+    ('mh_alcohol_current',
+     'Do you consume alcoholic beverages?', 'yes_no'),
+    ('mh_hep_hiv',
+     'Do you have or have you ever had Hep B, Hep C, HIV or AIDs?', 'yes_no'),
+    ('mh_autoimmune_disease',
+     "Do you have or have you ever been diagnosed with an autoimmune or inflammatory disease (ex. Type I Diabetes, Crohn's, IBS, rheumatoid arthritis, psoriasis, asthma, lupus, celiac disease, Sjogren's, multiple sclerosis, alopecia, vitiligo, Graves')?", 'yes_no'),
+    ('cons_blood_draw',
+     'Consent for Blood Draw?', 'yes_no'),
+    ('cons_discarded_samples',
+     'Consent for discarded samples?', 'yes_no'),
+    ('cons_liver',
+     'Consent to Liver Collection (1 gram)', 'yes_no'),
+    ('cons_fat',
+     'Consent to Fat Collection (5 grams)', 'yes_no'),
+    ('cons_follow_up_survey',
+     'Consent to Follow-Up Survey', 'yes_no'),
+    ('cons_future_contact',
+     'Consent to Contact for Future Research', 'yes_no'),
+    ('cons_future_use_diab_obes',
+     'Consent to specimens being used for future obesity and diabetes research', 'yes_no'),
+    ('cons_future_use_other',
+     'Consent to specimens being used for future health research (not related to diabetes or obesity).', 'yes_no'),
+    ('demo_sex', 'Gender', 'demo_sex'),
+    ('demo_race', 'Race', 'demo_race'),
+    ('demo_ethnicity', 'Ethnicity', 'demo_ethnicity'),
+    ('ae_severity', 'Severity?', 'ae_severity'),
+    ('add_study_dropdown', 'Study Name', 'additional_studies')]
+
+# Label prefixes that are replaced before coding
+label_substitutions = dict()
+label_substitutions['demo_race'] = {'Caucasian': 'White',
+                                    'African': 'Black or African American'}
+label_substitutions['demo_ethnicity'] = {'Non-Hispanic': 'Not Hispanic'}
+
+# Columns in the legacy export that the set_ functions read
+old_data_columns = ['Address',
+                    'Adverse Effects?',
+                    'ALT',
+                    'Any allergies? (latex, lidocaine)',
+                    'Are you on medications (including steroids, ibuprofen/anti-inflammatories)?',
+                    'Are you planning on being in the UK area for the next 3 years?',
+                    'AST',
+                    'Blood Pressure (Diastolic)',
+                    'Blood Pressure (Systolic)',
+                    'BMI',
+                    'Consent for Blood Draw?',
+                    'Consent for discarded samples?',
+                    'Consent to Contact for Future Research',
+                    'Consent to Fat Collection (5 grams)',
+                    'Consent to Follow-Up Survey',
+                    'Consent to Liver Collection (1 gram)',
+                    'Consent to specimens being used for future health research (not related to diabetes or obesity).',
+                    'Consent to specimens being used for future obesity and diabetes research',
+                    'Consent Version',
+                    'Consent Version Date',
+                    'Date of Birth',
+                    'Date of blood draw',
+                    'Date of Fat biopsy',
+                    'Date of Liver Biopsy',
+                    'Date of Withdrawal',
+                    'Date Patient Signed Consent',
+                    'Did the subject smoke in the last 12 hours?',
+                    'Did the subject take Aspirin/NSAIDs in the last 72 hours?',
+                    'Do you consume alcoholic beverages?',
+                    'Do you exercise? How often (type, duration)',
+                    "Do you have or have you ever been diagnosed with an autoimmune or inflammatory disease (ex. Type I Diabetes, Crohn's, IBS, rheumatoid arthritis, psoriasis, asthma, lupus, celiac disease, Sjogren's, multiple sclerosis, alopecia, vitiligo, Graves')?",
+                    'Do you have or have you ever had Hep B, Hep C, HIV or AIDs?',
+                    'Do you smoke?',
+                    'Email Address',
+                    'Emergency Contact Name',
+                    'Emergency Contact phone number',
+                    'End Date',
+                    'Ethnicity',
+                    'Event Name',
+                    'Gender',
+                    'Grams of Fat',
+                    'Have you had a cold/flu/ COVID in the last two weeks? If yes, when?',
+                    'HbA1c',
+                    'HDL',
+                    'Height (In total cm)',
+                    'Hematocrit Levels',
+                    'How often do consume alcoholic beverages?',
+                    'IRB Approval Date',
+                    'LDL',
+                    'Medical History? (diabetes, prediabetes, high blood pressure, kidney disease, heart attack, other)',
+                    'Outcome?',
+                    "Participant's Name",
+                    'Phone Number',
+                    'Pulse',
+                    'Race',
+                    'Respiratory Rate',
+                    'Severity?',
+                    'Start Date',
+                    'Study ID',
+                    'Study Name',
+                    'Surgical history (last 10 years)?',
+                    "Today's Date",
+                    'Total cholesterol',
+                    'Triglycerides',
+                    'TSH',
+                    'UK MRN',
+                    'Volume of blood draw (ml)',
+                    'Weight (in kg)']
+
+# Legacy event names and the events they map to
+event_names = {'Baseline': '0_months_arm_1',
+               '3 Month': '3_months_arm_1',
+               '6 Month': '6_months_arm_1',
+               'Year 1': '12_months_arm_1'}
+
+# Patterns for the text normalization
+emergency_contact_pattern = re.compile(
+    r'^(?P<name>.*?)\s*\((?P<relationship>.*?)\)')
+consent_version_pattern = re.compile(r'(\d+)')
+
 medication_list = ['metformin',
                    'sulfanourea',
                    'statins',
@@ -64,7 +200,32 @@ def create_import_from_orig_data(data_folder,
                                  consent_data_file_string,
                                  replace_values_file_string,
                                  new_fields_file_string,
-                                 import_file_string):
+                                 import_file_string,
+                                 csv_engine='c',
+                                 fail_fast=False,
+                                 codebook_file_string=None,
+                                 chunk_size=None,
+                                 resume=False,
+                                 data_dictionary_file_string=None):
+    """ Builds the REDCap import file from the legacy exports. The merged
+        data are validated first, the report is written next to the
+        import file and fail_fast stops the run if there are errors.
+        codebook_file_string is an optional json file that adds to or
+        replaces the dropdown lists in data_dicts.
+        If chunk_size is set, the rows are appended to the import file
+        every chunk_size patients and the last completed patient is saved
+        in a checkpoint file. resume picks up after that patient.
+        If data_dictionary_file_string is set, the rows are checked
+        against the REDCap data dictionary before they are written """
+    
+    # Build the codebook
+    default_dicts = dict(data_dicts)
+    default_dicts['mh_medication_checkboxes'] = medication_list
+    if (codebook_file_string is None):
+        codebook = return_codebook(default_dicts, label_substitutions)
+    else:
+        codebook = load_codebook(codebook_file_string, default_dicts,
+                                 label_substitutions)
     
     # Correct file names for paths
     old_data_file_string = os.path.join(data_folder, old_data_file_string)
@@ -77,9 +238,15 @@ def create_import_from_orig_data(data_folder,
     
     import_file_string = os.path.join(data_folder, import_file_string)
     
+    # Load the validators for the import
+    validators = None
+    if not (data_dictionary_file_string is None):
+        validators = load_field_validators(
+            os.path.join(data_folder, data_dictionary_file_string))
+    import_checks = []
+    
     # Load the old data    
-    old_data = pd.read_csv(old_data_file_string,
-                           converters={'UK MRN ': str})
+    old_data = read_csv_file(old_data_file_string, ['UK MRN '], csv_engine)
             
     # Correct badly formatted fields
     for c in old_data.columns:
@@ -97,8 +264,9 @@ def create_import_from_orig_data(data_folder,
     old_data = replace_fields(old_data, replace_values_data)
     
     # Load the consent data
-    consent_data = pd.read_csv(consent_data_file_string,
-                               converters = {'Patient Medical Record Number': str})
+    consent_data = read_csv_file(consent_data_file_string,
+                                 ['Patient Medical Record Number'],
+                                 csv_engine)
     
     # Correct badly formatted fields
     for c in consent_data.columns:
@@ -117,8 +285,9 @@ def create_import_from_orig_data(data_folder,
     # Get the original order
     old_unique_mrns = old_data['UK MRN'].unique()
 
-    # Add in diffs
-    diff_mrns = list(set(consent_data['Patient Medical Record Number']) - set(old_unique_mrns))
+    # Add in diffs, sorted so that record_id is the same on every run
+    diff_mrns = sorted(set(consent_data['Patient Medical Record Number']) -
+                       set(old_unique_mrns))
     
     old_unique_mrns = np.hstack([old_unique_mrns, diff_mrns])
     
@@ -129,17 +298,44 @@ def create_import_from_orig_data(data_folder,
                         how = 'outer',
                         suffixes = [None, '_consent'])
     
-    # update UK MRN
-    old_data['UK MRN'] = old_data['Patient Medical Record Number'].copy(deep=True)
+    # update UK MRN, as plain strings with NaN for missing so that the
+    # patient comparisons below work for either csv engine
+    old_data['UK MRN'] = old_data['Patient Medical Record Number'].to_numpy(
+        dtype=object, na_value=np.nan)
 
-    # Try to convert dates
+    # Try to convert dates, keeping the text so that the dates that
+    # cannot be read are reported rather than stopping the run
+    date_text = dict()
     for c in old_data.columns:
         if ('date' in c.lower()):
             if ('If less than' in c):
                 continue
+            # The pyarrow engine has already parsed ISO dates
+            if (pd.api.types.is_datetime64_any_dtype(old_data[c])):
+                continue
             old_data[c] = old_data[c].str.replace('NOT DONE', '')
             old_data[c] = old_data[c].str.replace('/', '-')
-            old_data[c] = pd.to_datetime(old_data[c])
+            date_text[c] = old_data[c]
+            old_data[c] = pd.to_datetime(old_data[c], errors='coerce')
+ 
+    # Check the data before the patient loop
+    d_report = return_validation_report(
+        validate_migration_data(old_data, codebook, date_text))
+    report_file_string = os.path.join(os.path.dirname(import_file_string),
+                                      'validation_report.csv')
+    d_report.to_csv(report_file_string, index=False)
+    if (fail_fast):
+        check_validation_report(d_report)
+    
+    # Tidy the names and contact details for all patients at once
+    old_data = normalize_baseline_data(old_data)
+    
+    # And code the yes/no and dropdown columns, unknown labels are left
+    # blank and tallied rather than stopping the run
+    (old_data, d_unknown) = code_legacy_data(old_data, codebook)
+    unknown_file_string = os.path.join(os.path.dirname(import_file_string),
+                                       'unknown_labels.csv')
+    d_unknown.to_csv(unknown_file_string, index=False)
  
     # Load the new fields and make an empty dataframe
     with open(new_fields_file_string, 'r') as f:
@@ -151,10 +347,26 @@ def create_import_from_orig_data(data_folder,
     for col in new_data.columns:
         if ('date' in col.lower()):
             new_data[col] = pd.to_datetime(new_data[col])
+    empty_data = new_data.copy(deep=True)
+    
+    # Set up the checkpoint
+    checkpoint_file_string = import_file_string + '.checkpoint.json'
+    patients_hash = hashlib.sha256(
+        '\n'.join(str(m) for m in old_unique_mrns).encode('utf-8')).hexdigest()
+    checkpoint = None
+    if not (chunk_size is None):
+        checkpoint = start_checkpoint(checkpoint_file_string,
+                                      import_file_string,
+                                      patients_hash, resume)
     
     # Cycle through the unique patients
     for (pat_index, old_un_mrn) in enumerate(old_unique_mrns):
         
+        # Skip the patients that were written before the restart
+        if not (checkpoint is None):
+            if (pat_index <= checkpoint['last_patient_index']):
+                continue
+        
         # Pull out the patient data
         d_pat = old_data[(old_data['UK MRN'] == old_un_mrn)].copy(deep=True)
 
@@ -195,28 +407,289 @@ def create_import_from_orig_data(data_folder,
             # Deduce the event
             old_event_name = d_visit['Event Name'].iloc[0]
             
-            if (old_event_name == 'Baseline'):
-                new_event_id = '0_months_arm_1'
-            elif (old_event_name == '3 Month'):
-                new_event_id = '3_months_arm_1'
-            elif (old_event_name == '6 Month'):
-                new_event_id = '6_months_arm_1'
-            elif (old_event_name == 'Year 1'):
-                new_event_id = '12_months_arm_1'
+            new_event_id = event_names[old_event_name]
                 
             # Set data
             new_data = set_visit_data(d_visit, pat_id, new_data, new_event_id)
             new_data = set_clin_data(d_visit, new_data)
-            new_data = set_med_hist_data(d_visit, new_data)
+            new_data = set_med_hist_data(d_visit, new_data, codebook)
             
             # Check for adverse event
             new_data = set_adverse_event_data(d_visit, pat_id, new_data)
+        
+        # Stream the finished patients to the file
+        if not (checkpoint is None):
+            if ((((pat_index + 1) % chunk_size) == 0) or
+                    (pat_index == (len(old_unique_mrns) - 1))):
+                if not (validators is None):
+                    import_checks = import_checks + validate_import_chunk(
+                        new_data, validators, fail_fast)
+                checkpoint = write_import_chunk(new_data, import_file_string,
+                                                checkpoint_file_string,
+                                                checkpoint, pat_index)
+                new_data = empty_data.copy(deep=True)
             
     # Write data to file
-    print('Writing import data to: %s' % import_file_string)
+    if (checkpoint is None):
+        if not (validators is None):
+            import_checks = validate_import_chunk(new_data, validators,
+                                                  fail_fast)
+        print('Writing import data to: %s' % import_file_string)
+        new_data.to_csv(import_file_string, sep=',', index=False,
+                        date_format='%Y-%m-%d')
+    else:
+        # The run is complete, so the next one starts from scratch
+        if (os.path.isfile(checkpoint_file_string)):
+            os.remove(checkpoint_file_string)
+        print('Import data written to: %s' % import_file_string)
+    
+    # Summarise the import checks, one row per field and check
+    if not (validators is None):
+        d_import_report = return_validation_report(
+            combine_import_checks(import_checks))
+        report_file_string = os.path.join(os.path.dirname(import_file_string),
+                                          'import_validation_report.csv')
+        d_import_report.to_csv(report_file_string, index=False)
+
+def validate_import_chunk(new_data, validators, fail_fast=False):
+    """ Checks rows against the data dictionary before they are written,
+        returns a list of report rows and, if fail_fast is set, stops
+        the run when a check with error severity fails """
+    
+    # Code
+    checks = validate_import_data(
+        return_import_text(new_data, date_format='%Y-%m-%d'), validators)
+    
+    if (fail_fast):
+        check_validation_report(pd.DataFrame(checks, columns=report_columns))
+    
+    return checks
+
+def combine_import_checks(checks):
+    """ Adds up the report rows from each chunk, keeping the first
+        examples for each check """
+    
+    # Code
+    combined = dict()
+    for c in checks:
+        key = (c['table'], c['check'], c['severity'])
+        if (key in combined):
+            combined[key]['no_of_rows'] += c['no_of_rows']
+        else:
+            combined[key] = dict(c)
+    
+    return list(combined.values())
+
+def start_checkpoint(checkpoint_file_string, import_file_string,
+                     patients_hash, resume):
+    """ Returns the checkpoint for a chunked run. On resume, the import
+        file is cut back to the rows from completed chunks, otherwise
+        the run starts from the first patient """
+    
+    # Code
+    if (resume and os.path.isfile(checkpoint_file_string)):
+        with open(checkpoint_file_string, 'r') as f:
+            checkpoint = json.load(f)
+        
+        if not (checkpoint['patients_hash'] == patients_hash):
+            raise ValueError('Checkpoint %s was made from different input '
+                             'data, rerun without resume' %
+                             checkpoint_file_string)
+        
+        # Drop anything written after the last checkpoint
+        with open(import_file_string, 'r+b') as f:
+            f.truncate(checkpoint['bytes_written'])
+        
+        print('Resuming after patient %i, %i rows already written' %
+              (checkpoint['last_patient_index'] + 1,
+               checkpoint['rows_written']))
+    else:
+        checkpoint = {'patients_hash': patients_hash,
+                      'last_patient_index': -1,
+                      'rows_written': 0,
+                      'bytes_written': 0}
+    
+    return checkpoint
+
+def write_import_chunk(new_data, import_file_string, checkpoint_file_string,
+                       checkpoint, pat_index):
+    """ Appends the rows for a chunk of patients to the import file and
+        records the last patient in the checkpoint file. Returns the
+        updated checkpoint """
+    
+    # Code
+    first_chunk = (checkpoint['bytes_written'] == 0)
+    if (first_chunk):
+        mode = 'w'
+        columns = list(new_data.columns)
+    else:
+        mode = 'a'
+        columns = checkpoint['columns']
+    
+    # Every chunk has to have the columns in the header
+    extra_columns = [c for c in new_data.columns if not (c in columns)]
+    if (extra_columns):
+        raise ValueError('Columns %s are not in the new fields file, so '
+                         'cannot be added after the first chunk' %
+                         extra_columns)
+    new_data = new_data[columns]
+    
     new_data.to_csv(import_file_string, sep=',', index=False,
-                    date_format='%Y-%m-%d')
+                    date_format='%Y-%m-%d', mode=mode, header=first_chunk)
+    
+    checkpoint = dict(checkpoint)
+    checkpoint['columns'] = columns
+    checkpoint['last_patient_index'] = int(pat_index)
+    checkpoint['rows_written'] = checkpoint['rows_written'] + len(new_data)
+    checkpoint['bytes_written'] = os.path.getsize(import_file_string)
+    
+    # Replace the file in one step so a crash cannot leave half of it
+    temp_file_string = checkpoint_file_string + '.tmp'
+    with open(temp_file_string, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_file_string, checkpoint_file_string)
+    
+    print('Written %i rows, up to patient %i' %
+          (checkpoint['rows_written'], pat_index + 1))
+    
+    return checkpoint
+    
+def validate_migration_data(old_data, codebook, date_text=None):
+    """ Checks the merged legacy data for the problems that would stop
+        or corrupt the migration, returns a list of report rows.
+        date_text holds the text of each date column before it was
+        converted, to find the dates that could not be read """
     
+    # Code
+    checks = []
+    
+    # Missing columns raise KeyErrors deep in the set_ functions
+    missing_columns = [c for c in old_data_columns
+                       if not (c in old_data.columns)]
+    checks.append(return_check(
+        'legacy', 'missing column', 'error',
+        [True] * len(missing_columns), missing_columns))
+    
+    # Unknown events are never assigned an event id
+    if ('Event Name' in old_data.columns):
+        events = old_data['Event Name']
+        checks.append(return_check(
+            'legacy', 'unknown Event Name', 'error',
+            events.notnull() & ~events.isin(event_names.keys()), events))
+    
+    # Medications must be in the codebook
+    drug_fields = [col for col in old_data.columns if 
+                   (col.startswith('Medication list') & (not 'Other' in col))]
+    drug_names = [df[df.find('=')+1:-1].lower() for df in drug_fields]
+    medication_codes = codebook['mh_medication_checkboxes']['codes']
+    checks.append(return_check(
+        'legacy', 'unknown medication', 'error',
+        [not (d in medication_codes) for d in drug_names], drug_names))
+    
+    # Dropdown labels
+    for (field, col, dict_key) in coded_columns:
+        if ((dict_key == 'yes_no') or not (col in old_data.columns)):
+            continue
+        (codes, unknown) = code_dropdown(old_data[col], codebook[dict_key])
+        checks.append(return_check(
+            'legacy', 'unknown %s' % col, 'error', unknown, old_data[col]))
+    
+    # Consent versions need a number
+    if ('Consent Version' in old_data.columns):
+        versions = old_data['Consent Version']
+        checks.append(return_check(
+            'legacy', 'Consent Version without a number', 'error',
+            versions.notnull() &
+                ~versions.astype(str).str.contains(r'\d', regex=True),
+            versions))
+    
+    # Dates that are filled in but could not be read
+    if (date_text is None):
+        date_text = dict()
+    for (c, text) in date_text.items():
+        checks.append(return_check(
+            'legacy', 'unreadable %s' % c, 'error',
+            text.notnull() & (text != '') & old_data[c].isnull(), text))
+    
+    # Patients that are in the legacy data but not the consent data
+    checks.append(return_check(
+        'legacy', 'MRN missing from consent data', 'warning',
+        old_data['Patient Medical Record Number'].isnull(),
+        old_data.index))
+    
+    return checks
+
+def code_legacy_data(old_data, codebook):
+    """ Adds a code_ column for each entry in coded_columns, coding the
+        whole column at once. Returns the data and a tally of the labels
+        that were not in the codebook """
+    
+    # Code
+    old_data = old_data.copy(deep=True)
+    tallies = []
+    
+    for (field, col, dict_key) in coded_columns:
+        if (dict_key == 'yes_no'):
+            old_data['code_%s' % field] = code_yes_no(old_data[col])
+            continue
+        
+        (codes, unknown) = code_dropdown(old_data[col], codebook[dict_key])
+        if (field == 'demo_race'):
+            # The checkbox to tick
+            codes = ('demo_race___' + codes.astype(str)).where(
+                codes.notnull())
+        old_data['code_%s' % field] = codes
+        tallies.append(return_unknown_tally(col, old_data[col], unknown))
+    
+    d_unknown = pd.concat(tallies, ignore_index=True)
+    
+    return (old_data, d_unknown)
+
+def normalize_baseline_data(old_data):
+    """ Adds normalized name, contact and consent columns, prefixed norm_,
+        for every row in a few column operations, so that the set_
+        functions only have to copy them """
+    
+    # Code
+    old_data = old_data.copy(deep=True)
+    
+    # Names, given name first, family name last, with a special case
+    # for Jr, and a middle initial if there are more than two parts
+    name_bits = return_text_values(
+        old_data["Participant's Name"]).str.split(' ')
+    no_of_bits = name_bits.str.len()
+    is_jr = name_bits.str.get(-1).str.startswith('Jr', na=False)
+    
+    old_data['norm_given_name'] = name_bits.str.get(0).str.title()
+    old_data['norm_family_name'] = name_bits.str.get(-1).str.title().mask(
+        is_jr, name_bits.str.get(-2).str.title() + ' Jr')
+    old_data['norm_initials'] = name_bits.str.get(1).str[0].where(
+        (no_of_bits > 2) & ~is_jr)
+    
+    # Email
+    old_data['norm_email'] = return_text_values(
+        old_data['Email Address']).str.lower()
+    
+    # Emergency contacts are "Name (Relationship)" or just a name
+    em_contact = return_text_values(old_data['Emergency Contact Name'])
+    em_parts = em_contact.str.extract(emergency_contact_pattern)
+    old_data['norm_emergency_name'] = \
+        em_parts['name'].where(em_parts['name'].notnull(),
+                               em_contact).str.lower().str.title()
+    old_data['norm_emergency_relationship'] = \
+        em_parts['relationship'].str.lower().str.title().where(
+            em_contact.notnull())
+    old_data.loc[em_contact.notnull() & em_parts['relationship'].isnull(),
+                 'norm_emergency_relationship'] = ''
+    
+    # Consent version number
+    consent_version = return_text_values(old_data['Consent Version'])
+    old_data['norm_consent_version'] = pd.to_numeric(
+        consent_version.str.extract(consent_version_pattern)[0]).astype(
+            'Int64')
+    
+    return old_data
+
 def set_adverse_event_data(d_visit, pat_id, d_import):
     """ Checks for adverse event and a new row to the import data
         if required """
@@ -245,8 +718,7 @@ def set_adverse_event_data(d_visit, pat_id, d_import):
         d_import['ae_end_date'].iat[event_row] = \
             d_visit['End Date'].iloc[0]
         d_import['ae_severity'].iat[event_row] = \
-            return_unit_off_index_for_key(
-                data_dicts['ae_severity'], d_visit['Severity?'].iloc[0])
+            d_visit['code_ae_severity'].iloc[0]
         d_import['ae_outcome'].iat[event_row] = strip_commas(
             d_visit['Outcome?'].iloc[0])
         
@@ -274,9 +746,7 @@ def set_additional_studies_data(d_patient, pat_id, d_import):
         
         # And the data
         d_import['add_study_dropdown'].iat[event_row] = \
-            return_unit_off_index_for_key(
-                data_dicts['additional_studies'],
-                d_patient['Study Name'].iloc[0])
+            d_patient['code_add_study_dropdown'].iloc[0]
         
         if (isinstance(d_patient['Study ID'].iloc[0], str)):
             d_import['add_alter_particip_id'].iat[event_row] = \
@@ -329,11 +799,9 @@ def set_clin_data(d_visit, d_import):
     
     # Set the data
     d_import['clin_smoked_before_visit'].iat[visit_row] = \
-        return_yes_no_value(
-            d_visit['Did the subject smoke in the last 12 hours?'].iloc[0])
+        d_visit['code_clin_smoked_before_visit'].iloc[0]
     d_import['clin_nsaid_before_visit'].iat[visit_row] = \
-        return_yes_no_value(
-            d_visit['Did the subject take Aspirin/NSAIDs in the last 72 hours?'].iloc[0])
+        d_visit['code_clin_nsaid_before_visit'].iloc[0]
     d_import['clin_hemat'].iat[visit_row] = \
         d_visit['Hematocrit Levels'].iloc[0]
     d_import['clin_tsh'].iat[visit_row] = \
@@ -369,26 +837,22 @@ def set_clin_data(d_visit, d_import):
         
     return (d_import)
 
-def set_med_hist_data(d_visit, d_import):
+def set_med_hist_data(d_visit, d_import, codebook):
     
     # Set the row
     visit_row = len(d_import) - 1
     
     d_import['mh_tobacco_current'].iat[visit_row] = \
-        return_yes_no_value(
-        d_visit['Do you smoke?'].iloc[0])
+        d_visit['code_mh_tobacco_current'].iloc[0]
     d_import['mh_alcohol_current'].iat[visit_row] = \
-        return_yes_no_value(
-        d_visit['Do you consume alcoholic beverages?'].iloc[0])
+        d_visit['code_mh_alcohol_current'].iloc[0]
     d_import['mh_alcohol_current_comments'].iat[visit_row] = \
         strip_commas(
             d_visit['How often do consume alcoholic beverages?'].iloc[0])
     d_import['mh_hep_hiv'].iat[visit_row] = \
-        return_yes_no_value(
-            d_visit['Do you have or have you ever had Hep B, Hep C, HIV or AIDs?'].iloc[0])
+        d_visit['code_mh_hep_hiv'].iloc[0]
     d_import['mh_autoimmune_disease'].iat[visit_row] = \
-        return_yes_no_value(
-            d_visit["Do you have or have you ever been diagnosed with an autoimmune or inflammatory disease (ex. Type I Diabetes, Crohn's, IBS, rheumatoid arthritis, psoriasis, asthma, lupus, celiac disease, Sjogren's, multiple sclerosis, alopecia, vitiligo, Graves')?"].iloc[0])        
+        d_visit['code_mh_autoimmune_disease'].iloc[0]        
     
     # And now the med comments
     d_import['mh_medical_history_comments'].iat[visit_row] = strip_commas(
@@ -398,12 +862,17 @@ def set_med_hist_data(d_visit, d_import):
     drug_fields = [col for col in d_visit.columns if 
                    (col.startswith('Medication list') & (not 'Other' in col))]
     
+    medication_codes = codebook['mh_medication_checkboxes']['codes']
+    
     for (i, df) in enumerate(drug_fields):
         eq_index = df.find('=')
         drug_name = df[eq_index+1:-1].lower()
-        med_index = medication_list.index(drug_name)
+        # Unknown drugs are reported by validate_migration_data
+        if not (drug_name in medication_codes):
+            continue
         if (d_visit[df].iloc[0] == 'Checked'):
-            import_field = 'mh_medication_checkboxes___%i' % (med_index+1)
+            import_field = 'mh_medication_checkboxes___%i' % \
+                medication_codes[drug_name]
             d_import[import_field].iat[visit_row] = 1
 
     # Back to easier things    
@@ -455,47 +924,24 @@ def set_demo_data(d_patient, pat_id, d_import):
     d_import['demo_uk_mrn'].iat[pat_row] = d_patient['UK MRN'].iloc[0]
     d_import['demo_enrollment_date'].iat[pat_row] = d_patient["Today's Date"].iloc[0]
     
-    # Name
-    if (isinstance(d_patient["Participant's Name"].iloc[0], str)):
-        name_bits = d_patient["Participant's Name"].iloc[0].split(' ')
-        d_import['demo_given_name'].iat[pat_row] = name_bits[0].title()
-        # Special case
-        if (name_bits[-1].startswith('Jr')):
-            d_import['demo_family_name'].iat[pat_row] = name_bits[-2].title() + \
-                ' Jr'
-        else:
-            d_import['demo_family_name'].iat[pat_row] = name_bits[-1].title()
-            if (len(name_bits) > 2):
-                d_import['demo_initials'].iat[pat_row] = name_bits[1][0]
+    # Name, from normalize_baseline_data
+    for (field, col) in [('demo_given_name', 'norm_given_name'),
+                         ('demo_family_name', 'norm_family_name'),
+                         ('demo_initials', 'norm_initials')]:
+        if (isinstance(d_patient[col].iloc[0], str)):
+            d_import[field].iat[pat_row] = d_patient[col].iloc[0]
             
     # Others
     d_import['demo_date_of_birth'].iat[pat_row] = d_patient['Date of Birth'].iloc[0]
-    if (isinstance(d_patient['Gender'].iloc[0], str)):
-        d_import['demo_sex'].iat[pat_row] = return_unit_off_index_for_key(
-            data_dicts['demo_sex'],
-            d_patient['Gender'].iloc[0])
-    
-    # Special case for race
-    if (isinstance(d_patient['Race'].iloc[0], str)):
-        pat_race = d_patient['Race'].iloc[0]
-        if pat_race.startswith('Caucasian'):
-            pat_race = 'White'
-        elif pat_race.startswith('African'):
-            pat_race = 'Black or African American'
-        uo_index = return_unit_off_index_for_key(
-            data_dicts['demo_race'],
-            pat_race)
-        temp_string = 'demo_race___%i' % uo_index
-        d_import[temp_string].iat[pat_row] = '1'
+    d_import['demo_sex'].iat[pat_row] = d_patient['code_demo_sex'].iloc[0]
+    
+    # Race is a checkbox, the coded column holds the box to tick
+    if (isinstance(d_patient['code_demo_race'].iloc[0], str)):
+        d_import[d_patient['code_demo_race'].iloc[0]].iat[pat_row] = '1'
     
     # Hispanic
-    if (isinstance(d_patient['Ethnicity'].iloc[0], str)):
-        hisp_string = d_patient['Ethnicity'].iloc[0]
-        if (hisp_string == 'Non-Hispanic'):
-            hisp_string = 'Not Hispanic'
-        d_import['demo_ethnicity'].iat[pat_row] = return_unit_off_index_for_key(
-            data_dicts['demo_ethnicity'],
-            hisp_string)
+    d_import['demo_ethnicity'].iat[pat_row] = \
+        d_patient['code_demo_ethnicity'].iloc[0]
     
     # Planning to be at UK
     plan_to_stay = d_patient['Are you planning on being in the UK area for the next 3 years?'].iloc[0]
@@ -516,9 +962,9 @@ def set_contact_data(d_patient, pat_id, d_import):
     d_import['contact_phone_number'].iat[pat_row] = \
         d_patient['Phone Number'].iloc[0]
     
-    if (isinstance(d_patient['Email Address'].iloc[0], str)):
+    if (isinstance(d_patient['norm_email'].iloc[0], str)):
         d_import['contact_email'].iat[pat_row] = \
-                d_patient['Email Address'].iloc[0].lower()
+                d_patient['norm_email'].iloc[0]
        
     # Parse the address
     if (isinstance(d_patient['Address'].iloc[0], str)):
@@ -554,20 +1000,12 @@ def set_contact_data(d_patient, pat_id, d_import):
         d_import['contact_state'].iat[pat_row] = add['StateName']
         d_import['contact_zip'].iat[pat_row] = add['ZipCode']
     
-    # Parse the emergency contact
-    if (isinstance(d_patient['Emergency Contact Name'], str)):        
-        em_contact = str(d_patient['Emergency Contact Name'].iloc[0])
-        try:
-            relationship = re.search(r'\((.*?)\)',em_contact)
-            if (relationship):
-                d_import['contact_emergency_name'].iat[pat_row] = \
-                    em_contact[0 : relationship.start() - 1].lower().title()
-                d_import['contact_emergency_relationship'].iat[pat_row] = \
-                    em_contact[relationship.start()+1 : relationship.end()-1].lower().title()
-        except:
-            d_import['contact_emergency_name'].iat[pat_row] = \
-                str(d_patient['Emergency Contact Name'].iloc[0]).lower().title()
-            d_import['contact_emergency_relationship'].iat[pat_row] = ''
+    # Emergency contact, parsed by normalize_baseline_data
+    if (isinstance(d_patient['norm_emergency_name'].iloc[0], str)):
+        d_import['contact_emergency_name'].iat[pat_row] = \
+            d_patient['norm_emergency_name'].iloc[0]
+        d_import['contact_emergency_relationship'].iat[pat_row] = \
+            d_patient['norm_emergency_relationship'].iloc[0]
     
     d_import['contact_emergency_phone'].iat[pat_row] = \
         d_patient['Emergency Contact phone number'].iloc[0]
@@ -584,10 +1022,10 @@ def set_consent_data(d_patient, pat_id, d_import):
     d_import['cons_date_signed'].iat[pat_row] = \
         d_patient['Date Patient Signed Consent'].iloc[0]
         
-    # Get number from consent version string
-    if (isinstance(d_patient['Consent Version'].iloc[0], str)):
-        version_int = int(re.search(r'\d+', d_patient['Consent Version'].iloc[0]).group())
-        d_import['cons_version'].iat[pat_row] = version_int
+    # Consent version number, from normalize_baseline_data
+    if not (pd.isnull(d_patient['norm_consent_version'].iloc[0])):
+        d_import['cons_version'].iat[pat_row] = \
+            int(d_patient['norm_consent_version'].iloc[0])
     
     d_import['cons_version_date'].iat[pat_row] = \
         d_patient['Consent Version Date'].iloc[0]
@@ -596,28 +1034,28 @@ def set_consent_data(d_patient, pat_id, d_import):
         d_patient['IRB Approval Date'].iloc[0]
         
     d_import['cons_blood_draw'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent for Blood Draw?'].iloc[0])
+        d_patient['code_cons_blood_draw'].iloc[0]
         
     d_import['cons_discarded_samples'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent for discarded samples?'].iloc[0])
+        d_patient['code_cons_discarded_samples'].iloc[0]
         
     d_import['cons_liver'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent to Liver Collection (1 gram)'].iloc[0])
+        d_patient['code_cons_liver'].iloc[0]
          
     d_import['cons_fat'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent to Fat Collection (5 grams)'].iloc[0])
+        d_patient['code_cons_fat'].iloc[0]
 
     d_import['cons_follow_up_survey'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent to Follow-Up Survey'].iloc[0])
+        d_patient['code_cons_follow_up_survey'].iloc[0]
 
     d_import['cons_future_contact'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent to Contact for Future Research'].iloc[0])
+        d_patient['code_cons_future_contact'].iloc[0]
 
     d_import['cons_future_use_diab_obes'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent to specimens being used for future obesity and diabetes research'].iloc[0])
+        d_patient['code_cons_future_use_diab_obes'].iloc[0]
 
     d_import['cons_future_use_other'].iat[pat_row] = \
-        return_yes_no_value(d_patient['Consent to specimens being used for future health research (not related to diabetes or obesity).'].iloc[0])
+        d_patient['code_cons_future_use_other'].iloc[0]
 
     d_import['cons_withdrawn_date'].iat[pat_row] = \
         d_patient['Date of Withdrawal'].iloc[0]
@@ -625,25 +1063,6 @@ def set_consent_data(d_patient, pat_id, d_import):
     # Return
     return (d_import)
 
-def return_unit_off_index_for_key(dictionary, keyword):
-    
-    uo_index = dictionary.index(keyword) + 1
-    
-    return uo_index
-
-def return_yes_no_value(keyword):
-    """ Returns 1 for yes and 0 for no """
-    
-    return_value = ''
-    
-    if (isinstance(keyword, str)):
-        if (keyword.lower() == 'yes'):
-            return_value = 1
-        else:
-            return_value = 0
-            
-    return return_value
-    
 def strip_commas(var):
     """ Strips commas from a variable if it is a string """
     
@@ -682,12 +1101,7 @@ def tidy_mrn(mrn_string):
     return mrn_string
 
 if __name__ == "__main__":
-    create_import_from_orig_data(data_folder,
-                                 old_data_file_string,
-                                 consent_data_file_string,
-                                 replace_values_file_string,
-                                 new_fields_file_string,
-                                 import_file_string)
     
-
-
+    # Same as adore.py migrate, which defaults to the paths above
+    from adore import main
+    sys.exit(main(['migrate']))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:57:21 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+# Engines that can be passed to read_csv_file
+csv_engines = ['c', 'pyarrow']
+
+
+def read_csv_file(file_string, string_columns, csv_engine='c',
+                  usecols=None):
+    """ Reads a csv file keeping the string_columns (typically MRNs) as
+        strings so that leading zeros survive.
+        csv_engine 'c' uses pandas' default parser with converters.
+        csv_engine 'pyarrow' uses Arrow's multithreaded reader with explicit
+        string types instead of Python converters. Only the string_columns
+        are returned Arrow-backed, with empty entries as '' to match 'c'.
+        Other text columns stay as object, because the row by row code
+        compares their entries directly and <NA> cannot be compared. """
+
+    # Code
+    if not (csv_engine in csv_engines):
+        raise ValueError('Unknown csv engine: %s' % csv_engine)
+
+    if (csv_engine == 'c'):
+        d = pd.read_csv(file_string,
+                        converters={c: str for c in string_columns},
+                        usecols=usecols)
+        return d
+
+    # Only imported when needed
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    read_options = pv.ReadOptions(use_threads=True)
+    convert_options = pv.ConvertOptions(
+        column_types={c: pa.string() for c in string_columns},
+        include_columns=usecols,
+        strings_can_be_null=True)
+
+    table = pv.read_csv(file_string, read_options=read_options,
+                        convert_options=convert_options)
+
+    # Dates come back as datetime64 rather than datetime.date objects
+    d = table.to_pandas(date_as_object=False)
+
+    # Missing text is None from Arrow, and NaN from 'c'
+    for c in d.columns:
+        if (d[c].dtype == object):
+            d[c] = d[c].where(d[c].notnull(), np.nan)
+
+    # Keep the string columns in Arrow memory, empty MRNs are '' to match 'c'
+    for c in string_columns:
+        if (c in d.columns):
+            d[c] = pd.arrays.ArrowStringArray(
+                table.column(c).fill_null(''))
+
+    return d
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:16:20 2026
+"""
+
+import os
+import io
+import functools
+
+import pandas as pd
+
+from data_validation import return_check
+
+# Columns in the REDCap data dictionary export
+dictionary_columns = {'field': 'Variable / Field Name',
+                      'form': 'Form Name',
+                      'type': 'Field Type',
+                      'choices': 'Choices, Calculations, OR Slider Labels',
+                      'validation': 'Text Validation Type OR Show Slider Number',
+                      'min': 'Text Validation Min',
+                      'max': 'Text Validation Max',
+                      'required': 'Required Field?'}
+
+# Columns REDCap adds to every import
+system_fields = ['record_id', 'redcap_event_name', 'redcap_repeat_instrument',
+                 'redcap_repeat_instance', 'redcap_data_access_group']
+
+# Patterns for the text validation types, as REDCap expects them in an
+# import file
+validation_patterns = {
+    'date_ymd': r'\d{4}-\d{2}-\d{2}',
+    'date_mdy': r'\d{4}-\d{2}-\d{2}',
+    'date_dmy': r'\d{4}-\d{2}-\d{2}',
+    'datetime_ymd': r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}',
+    'datetime_mdy': r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}',
+    'datetime_dmy': r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}',
+    'time': r'\d{2}:\d{2}',
+    'integer': r'-?\d+',
+    'number': r'-?(\d+\.?\d*|\.\d+)',
+    'email': r'[^@\s]+@[^@\s]+\.[^@\s]+',
+    'phone': r'\(?\d{3}\)?[-. ]?\d{3}[-. ]?\d{4}',
+    'zipcode': r'\d{5}(-\d{4})?'}
+
+# Field types that are coded with fixed choices
+coded_field_types = {'yesno': ['0', '1'],
+                     'truefalse': ['0', '1']}
+
+
+def load_field_validators(dictionary_file_string):
+    """ Returns the validators for each field in a REDCap data dictionary
+        export. These are cached, so the file is only read again if it
+        changes """
+
+    # Code
+    return return_cached_validators(
+        dictionary_file_string, os.path.getmtime(dictionary_file_string))
+
+@functools.lru_cache(maxsize=8)
+def return_cached_validators(dictionary_file_string, modified_time):
+    """ Reads the dictionary and compiles the validators, modified_time
+        is only used as part of the cache key """
+
+    # Code
+    d_dict = pd.read_csv(dictionary_file_string, dtype=str,
+                         keep_default_na=False)
+
+    return return_field_validators(d_dict)
+
+def return_field_validators(d_dict):
+    """ Compiles each row of the data dictionary into a dict with
+        'form' - the instrument holding the field
+        'type' - the REDCap field type
+        'choices' - list of allowed codes, or None
+        'pattern' - regular expression for text validation, or None
+        'min', 'max' - numeric range, or None
+        'required' - True if the field is required
+        Checkbox fields add one validator for each box, field___code """
+
+    # Code
+    validators = dict()
+
+    for i in range(len(d_dict)):
+        row = dict()
+        for (k, c) in dictionary_columns.items():
+            row[k] = d_dict[c].iloc[i].strip() if (c in d_dict.columns) else ''
+
+        validator = {'form': row['form'],
+                     'type': row['type'],
+                     'choices': None,
+                     'pattern': None,
+                     'min': return_number(row['min']),
+                     'max': return_number(row['max']),
+                     'required': (row['required'].lower() == 'y')}
+
+        if (row['type'] in ['dropdown', 'radio']):
+            validator['choices'] = list(return_choices(row['choices']))
+        elif (row['type'] in coded_field_types):
+            validator['choices'] = coded_field_types[row['type']]
+        elif (row['type'] == 'text'):
+            validator['pattern'] = \
+                validation_patterns.get(row['validation'], None)
+
+        if (row['type'] == 'checkbox'):
+            # Each box is its own column in the import
+            for code in return_choices(row['choices']):
+                box = dict(validator)
+                box['choices'] = ['0', '1']
+                box['required'] = False
+                validators['%s___%s' % (row['field'], code.lower())] = box
+        else:
+            validators[row['field']] = validator
+
+    return validators
+
+def return_choices(choices_string):
+    """ Returns a dict of code: label from a REDCap choices string of the
+        form '1, Female | 2, Male' """
+
+    # Code
+    choices = dict()
+    for choice in choices_string.split('|'):
+        if (choice.strip() == ''):
+            continue
+        (code, _, label) = choice.partition(',')
+        choices[code.strip()] = label.strip()
+
+    return choices
+
+def return_number(number_string):
+    """ Returns a float, or None if the string is not a number """
+
+    # Code
+    try:
+        return float(number_string)
+    except ValueError:
+        return None
+
+def return_import_text(d_import, date_format='%Y-%m-%d'):
+    """ Returns the import as the strings that will be written to the
+        csv file, with '' for blanks """
+
+    # Code
+    text = d_import.to_csv(index=False, date_format=date_format)
+
+    return pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False)
+
+def validate_import_data(d_text, validators, table='import'):
+    """ Checks each column of an import, as returned by return_import_text,
+        against the validators. Returns a list of report rows for the
+        checks that failed """
+
+    # Code
+    checks = []
+    labels = d_text['record_id'] if ('record_id' in d_text.columns) \
+        else pd.Series(range(len(d_text))).astype(str)
+    if ('redcap_event_name' in d_text.columns):
+        labels = labels + ' ' + d_text['redcap_event_name']
+
+    # Blank rows for each form, required fields are only checked on rows
+    # where the form has been started
+    form_started = dict()
+    for (field, v) in validators.items():
+        if (field in d_text.columns):
+            started = form_started.get(v['form'], False)
+            form_started[v['form']] = started | (d_text[field] != '')
+
+    for field in d_text.columns:
+
+        if (field in system_fields):
+            continue
+
+        # Form status fields, e.g. demographics_complete
+        if (field.endswith('_complete') and
+                (field[:-len('_complete')] in form_started)):
+            v = {'form': field[:-len('_complete')], 'type': 'dropdown',
+                 'choices': ['0', '1', '2'], 'pattern': None,
+                 'min': None, 'max': None, 'required': False}
+        elif (field in validators):
+            v = validators[field]
+        else:
+            checks.append(return_check(
+                table, '%s not in the data dictionary' % field, 'error',
+                pd.Series(True, index=d_text.index), labels,
+                no_of_examples=1))
+            continue
+
+        values = d_text[field]
+        filled = (values != '')
+
+        if (v['type'] in ['calc', 'descriptive', 'file']):
+            checks.append(return_check(
+                table, '%s is a %s field and cannot be imported' %
+                    (field, v['type']),
+                'warning', filled, labels + ': ' + values))
+            continue
+
+        if not (v['choices'] is None):
+            checks.append(return_check(
+                table, '%s not one of the choices' % field, 'error',
+                filled & ~values.isin(v['choices']),
+                labels + ': ' + values))
+
+        if not (v['pattern'] is None):
+            checks.append(return_check(
+                table, '%s wrong format' % field, 'error',
+                filled & ~values.str.fullmatch(v['pattern']),
+                labels + ': ' + values))
+
+        if not ((v['min'] is None) and (v['max'] is None)):
+            numbers = pd.to_numeric(values, errors='coerce')
+            out_of_range = pd.Series(False, index=values.index)
+            if not (v['min'] is None):
+                out_of_range = out_of_range | (numbers < v['min'])
+            if not (v['max'] is None):
+                out_of_range = out_of_range | (numbers > v['max'])
+            checks.append(return_check(
+                table, '%s out of range' % field, 'warning',
+                out_of_range, labels + ': ' + values))
+
+        if (v['required']):
+            checks.append(return_check(
+                table, '%s required but blank' % field, 'warning',
+                form_started[v['form']] & ~filled, labels))
+
+    # Only keep the checks that failed, there is one per field
+    return [c for c in checks if (c['no_of_rows'] > 0)]
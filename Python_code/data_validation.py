@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:59:11 2026
+"""
+
+import pandas as pd
+
+# Columns in the validation report
+report_columns = ['table', 'check', 'severity', 'no_of_rows', 'examples']
+
+
+def return_check(table, check, severity, mask, labels, no_of_examples=5):
+    """ Summarises one check as a report row. mask flags the failing rows,
+        labels identify them in the examples """
+
+    # Code
+    failing = pd.Series(labels)[pd.Series(mask).to_numpy()]
+    examples = [str(x) for x in failing.unique()[:no_of_examples]]
+
+    return {'table': table,
+            'check': check,
+            'severity': severity,
+            'no_of_rows': int(pd.Series(mask).sum()),
+            'examples': '; '.join(examples)}
+
+def validate_REDCap_data(d_redcap):
+    """ Checks the REDCap report, returns a list of report rows """
+
+    # Code
+    checks = []
+
+    # Sample events need a visit date to match against, dates that could
+    # not be read are NaT too
+    months = d_redcap['redcap_event_name'].str.contains('months', na=False)
+    checks.append(return_check(
+        'REDCap', 'months event without a readable visit_date', 'warning',
+        months & d_redcap['visit_date'].isnull(),
+        d_redcap['record_id'].astype(str) + ' ' +
+        d_redcap['redcap_event_name'].astype(str)))
+
+    # Only use the MRNs that were in the report, not the ones forward
+    # filled from the record above
+    if ('demo_uk_mrn_filled' in d_redcap.columns):
+        given = ~d_redcap['demo_uk_mrn_filled']
+    else:
+        given = (d_redcap['demo_uk_mrn'] != 'nan')
+
+    # Each MRN should belong to one record
+    d_pairs = d_redcap.loc[given, ['demo_uk_mrn', 'record_id']].drop_duplicates()
+    no_of_ids = d_pairs.groupby('demo_uk_mrn')['record_id'].transform('nunique')
+    checks.append(return_check(
+        'REDCap', 'MRN with more than one record_id', 'error',
+        no_of_ids > 1,
+        d_pairs['demo_uk_mrn']))
+
+    own_mrn = given.groupby(d_redcap['record_id'], sort=False).any()
+    checks.append(return_check(
+        'REDCap', 'record_id without an MRN', 'warning',
+        ~own_mrn,
+        own_mrn.index.to_series()))
+
+    return checks
+
+def validate_OnCore_data(d_oncore, d_redcap, known_statuses,
+                         known_sample_types, match_window_days=10):
+    """ Checks the OnCore report against itself and the REDCap visits,
+        returns a list of report rows """
+
+    # Variables
+    today = pd.Timestamp.today().normalize()
+
+    # Code
+    checks = []
+    specimen_nos = d_oncore['Specimen No.']
+
+    checks.append(return_check(
+        'OnCore', 'duplicate Specimen No.', 'error',
+        specimen_nos.duplicated(keep=False), specimen_nos))
+
+    collection_dates = d_oncore['Collection Date']
+
+    checks.append(return_check(
+        'OnCore', 'missing or unreadable Collection Date', 'error',
+        collection_dates.isnull(), specimen_nos))
+
+    checks.append(return_check(
+        'OnCore', 'Collection Date in the future', 'error',
+        collection_dates > today, specimen_nos))
+
+    # Enrollment is the first sample visit for each patient
+    months = d_redcap['redcap_event_name'].str.contains('months', na=False)
+    enrollment = d_redcap[months].groupby('demo_uk_mrn')['visit_date'].min()
+    patient_enrollment = d_oncore['Patient ID'].map(enrollment)
+    checks.append(return_check(
+        'OnCore', 'Collection Date before enrollment', 'warning',
+        collection_dates < (patient_enrollment -
+                            pd.Timedelta(days=match_window_days)),
+        specimen_nos))
+
+    # Labels that will not be counted
+    statuses = d_oncore['Specimen Status']
+    checks.append(return_check(
+        'OnCore', 'unknown Specimen Status', 'warning',
+        ~statuses.isin(known_statuses), statuses))
+
+    checks.append(return_check(
+        'OnCore', 'unknown Specimen Type or Body Site', 'warning',
+        ~d_oncore['ADORE sample type'].isin(known_sample_types),
+        d_oncore['Specimen Type'].astype(str) + ' / ' +
+        d_oncore['Body Site'].astype(str)))
+
+    return checks
+
+def return_validation_report(checks):
+    """ Turns a list of report rows into a dataframe and prints the
+        checks that failed """
+
+    # Code
+    d_report = pd.DataFrame(checks, columns=report_columns)
+
+    for i in range(len(d_report)):
+        if (d_report['no_of_rows'].iloc[i] > 0):
+            print('Validation %s: %s %s, %i rows, e.g. %s' %
+                  (d_report['severity'].iloc[i],
+                   d_report['table'].iloc[i],
+                   d_report['check'].iloc[i],
+                   d_report['no_of_rows'].iloc[i],
+                   d_report['examples'].iloc[i]))
+
+    return d_report
+
+def check_validation_report(d_report):
+    """ Raises an error if any check with error severity failed """
+
+    # Code
+    d_failed = d_report[(d_report['severity'] == 'error') &
+                        (d_report['no_of_rows'] > 0)]
+
+    if not (d_failed.empty):
+        raise ValueError('Validation failed: %s' %
+                         '; '.join(d_failed['table'] + ' ' +
+                                   d_failed['check']))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:50:30 2026
+"""
+
+import os
+
+import pandas as pd
+
+
+def return_previous_import(previous_file_string):
+    """ Loads the counts the new import is compared to. This can be the
+        full redcap_import.csv from an earlier run or a raw REDCap export
+        that includes the sa_ fields """
+
+    # Code
+
+    # Read everything as strings so that blanks stay blanks
+    d = pd.read_csv(previous_file_string, dtype=str, keep_default_na=False)
+
+    # REDCap exports have a row for every event, the counts are global
+    if ('redcap_event_name' in d.columns):
+        d = d[d['redcap_event_name'] == 'global_arm_1']
+
+    d = d.drop_duplicates(subset='record_id', keep='last')
+
+    # Return
+    return d
+
+def return_import_diff(d_import, d_previous):
+    """ Compares the new import with the previous counts and returns
+        (d_diff, d_changelog)
+            d_diff - the records and fields that changed, with unchanged
+                     cells in those records left blank so REDCap skips them
+            d_changelog - one row per changed cell """
+
+    # Variables
+    key_fields = ['record_id', 'redcap_event_name']
+
+    # Code
+    fields = [c for c in d_import.columns if not (c in key_fields)]
+
+    # Align the previous values on the new records and fields, fields
+    # or records that were not there before count as changed
+    d_new = d_import.copy(deep=True)
+    d_new.index = d_new['record_id'].astype(str)
+    d_new = d_new[fields]
+
+    d_old = d_previous.copy(deep=True)
+    d_old.index = d_old['record_id'].astype(str)
+    d_old = d_old.reindex(index=d_new.index, columns=fields)
+
+    new_values = d_new.apply(pd.to_numeric, errors='coerce')
+    old_values = d_old.apply(pd.to_numeric, errors='coerce')
+
+    changed = ~((new_values == old_values) |
+                (new_values.isnull() & old_values.isnull()))
+
+    changed_rows = changed.any(axis=1)
+    changed_cols = changed.any(axis=0)
+
+    # Build the diff
+    d_diff = d_new.loc[changed_rows, changed_cols]
+    d_diff = d_diff.astype(object).where(
+        changed.loc[changed_rows, changed_cols], '')
+    d_diff = d_diff.reset_index(drop=True)
+    d_diff.insert(0, 'record_id',
+                  d_import.loc[changed_rows.to_numpy(), 'record_id'].to_numpy())
+    d_diff.insert(1, 'redcap_event_name', 'global_arm_1')
+
+    # And the changelog
+    cells = changed.stack()
+    cells = cells[cells]
+    d_changelog = pd.DataFrame(
+        {'record_id': cells.index.get_level_values(0),
+         'field': cells.index.get_level_values(1)})
+    d_changelog['old_value'] = [d_old.at[r, f] for (r, f) in cells.index]
+    d_changelog['new_value'] = [d_new.at[r, f] for (r, f) in cells.index]
+
+    print('Import diff: %i of %i records and %i of %i fields changed' %
+          (changed_rows.sum(), len(changed_rows),
+           changed_cols.sum(), len(changed_cols)))
+
+    # Return
+    return (d_diff, d_changelog)
+
+def write_import_diff(d_diff_and_changelog, output_folder):
+    """ Writes the diff-only import and its changelog """
+
+    # Code
+    (d_diff, d_changelog) = d_diff_and_changelog
+
+    diff_file_string = os.path.join(output_folder, 'redcap_import_diff.csv')
+    d_diff.to_csv(diff_file_string, index=False)
+
+    changelog_file_string = os.path.join(output_folder,
+                                         'redcap_import_changelog.csv')
+    d_changelog.to_csv(changelog_file_string, index=False)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:55:38 2026
+"""
+
+import pandas as pd
+
+
+def return_mrn_candidates(d_redcap, d_oncore, max_distance=2,
+                          max_candidates=3):
+    """ Finds the nearest REDCap MRNs for each OnCore Patient ID that was
+        not found in REDCap, returns a dataframe with one row per candidate.
+        Typos and transposed digits are both distance 1 """
+
+    # Code
+
+    # Map the REDCap MRNs to record_ids
+    d_mrns = d_redcap[['demo_uk_mrn', 'record_id']].drop_duplicates(
+        subset='demo_uk_mrn')
+    d_mrns = d_mrns[d_mrns['demo_uk_mrn'] != 'nan']
+    record_ids = dict(zip(d_mrns['demo_uk_mrn'], d_mrns['record_id']))
+
+    # Index them
+    index = build_deletion_index(record_ids.keys(), max_distance)
+
+    # Find the unmatched patients and their sample counts
+    d_not_found = d_oncore[d_oncore['REDCap_patient_found'] == False]
+    no_of_samples = d_not_found['Patient ID'].value_counts(sort=False)
+
+    rows = []
+    for (patient_id, n) in no_of_samples.items():
+        matches = search_deletion_index(index, patient_id, max_distance)
+        for (rank, (dist, mrn)) in enumerate(matches[:max_candidates]):
+            rows.append([patient_id, n, rank + 1, mrn, record_ids[mrn], dist])
+
+    d_candidates = pd.DataFrame(rows,
+                                columns=['Patient ID', 'no_of_samples',
+                                         'candidate_rank', 'candidate_mrn',
+                                         'candidate_record_id',
+                                         'edit_distance'])
+
+    print('MRN reconciliation: %i of %i unmatched Patient IDs have candidates' %
+          (d_candidates['Patient ID'].nunique(), len(no_of_samples)))
+
+    # Return
+    return d_candidates
+
+def build_deletion_index(words, max_distance):
+    """ Indexes each word under every string that can be made by deleting
+        up to max_distance characters from it. Two words within
+        max_distance edits share at least one of these keys, so a search
+        only has to check the words under the query's own keys """
+
+    # Code
+    index = dict()
+
+    for w in words:
+        for key in return_deletions(w, max_distance):
+            index.setdefault(key, []).append(w)
+
+    return index
+
+def search_deletion_index(index, query, max_distance):
+    """ Returns a sorted list of (distance, word) for all of the indexed
+        words within max_distance of the query """
+
+    # Code
+    candidates = set()
+    for key in return_deletions(query, max_distance):
+        candidates.update(index.get(key, []))
+
+    matches = []
+    for w in candidates:
+        dist = edit_distance(query, w)
+        if (dist <= max_distance):
+            matches.append((dist, w))
+
+    matches.sort()
+
+    return matches
+
+def return_deletions(word, max_distance):
+    """ Returns the set of strings made by deleting up to max_distance
+        characters from the word, including the word itself """
+
+    # Code
+    deletions = {word}
+    current = {word}
+
+    for i in range(max_distance):
+        current = {w[:j] + w[j+1:] for w in current for j in range(len(w))}
+        deletions.update(current)
+
+    return deletions
+
+def edit_distance(a, b):
+    """ Returns the edit distance between two strings, counting an
+        insertion, deletion, substitution or swap of neighbouring
+        characters as one edit """
+
+    # Code
+    d = [[0] * (len(b) + 1) for i in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i][0] = i
+    for j in range(len(b) + 1):
+        d[0][j] = j
+
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i-1][j] + 1,
+                          d[i][j-1] + 1,
+                          d[i-1][j-1] + (a[i-1] != b[j-1]))
+            # Transposed digits
+            if ((i > 1) and (j > 1) and (a[i-1] == b[j-2]) and
+                    (a[i-2] == b[j-1])):
+                d[i][j] = min(d[i][j], d[i-2][j-2] + 1)
+
+    return d[-1][-1]
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:19:38 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+# Visit columns held for each MRN and event, if they are in the report
+visit_columns = ['visit_date', 'visit_liver_procured', 'visit_fat_procured',
+                 'visit_blood_procured']
+
+# Columns in the conflicts table
+conflict_columns = ['record_id', 'demo_uk_mrn', 'conflict']
+
+
+def return_patient_registry(d_redcap):
+    """ Builds the lookups used by matching and counting from the REDCap
+        report, once. Returns a dict with
+            'record_ids' - array of record_ids in report order
+            'record_mrns' - array of the first MRN for each record
+            'record_index' - dict of record_id: position in the arrays
+            'mrn_records' - dict of MRN: list of record_ids
+            'visits' - dict of MRN: {event: {visit column: value}},
+                       holding the first row for each MRN and event
+            'sample_events' - list of the events with samples
+            'd_conflicts' - dataframe of the MRNs and records that do
+                            not map one to one """
+
+    # Code
+
+    # Records and their first MRN
+    d_patients = d_redcap[['record_id', 'demo_uk_mrn']].drop_duplicates(
+        subset='record_id')
+    record_ids = d_patients['record_id'].to_numpy()
+    record_mrns = d_patients['demo_uk_mrn'].to_numpy(dtype=object)
+
+    record_index = {r: i for (i, r) in enumerate(record_ids)}
+
+    mrn_records = dict()
+    for (r, mrn) in zip(record_ids, record_mrns):
+        mrn_records.setdefault(mrn, []).append(r)
+
+    # First visit for each MRN and event
+    columns = [c for c in visit_columns if (c in d_redcap.columns)]
+    d_visits = d_redcap.drop_duplicates(
+        subset=['demo_uk_mrn', 'redcap_event_name'])
+
+    visits = dict()
+    for (mrn, event, *values) in zip(d_visits['demo_uk_mrn'],
+                                     d_visits['redcap_event_name'],
+                                     *[d_visits[c] for c in columns]):
+        visits.setdefault(mrn, dict())[event] = dict(zip(columns, values))
+
+    # Events with samples, in the order they appear
+    sample_events = [x for x in d_redcap['redcap_event_name'].unique()
+                     if ('months' in x)]
+
+    registry = {'record_ids': record_ids,
+                'record_mrns': record_mrns,
+                'record_index': record_index,
+                'mrn_records': mrn_records,
+                'visits': visits,
+                'sample_events': sample_events,
+                'd_conflicts': return_registry_conflicts(d_redcap)}
+
+    return registry
+
+def return_registry_conflicts(d_redcap):
+    """ Finds the MRNs and records that do not map one to one, including
+        records that only have an MRN because it was forward filled from
+        the record above """
+
+    # Code
+    d_pairs = d_redcap[['record_id', 'demo_uk_mrn']].drop_duplicates()
+    has_mrn = (d_pairs['demo_uk_mrn'] != 'nan')
+
+    conflicts = []
+
+    no_of_records = d_pairs.groupby('demo_uk_mrn')['record_id'].transform(
+        'nunique')
+    d = d_pairs[has_mrn & (no_of_records > 1)]
+    conflicts.append(d.assign(conflict='MRN shared by more than one record'))
+
+    no_of_mrns = d_pairs.groupby('record_id')['demo_uk_mrn'].transform(
+        'nunique')
+    d = d_pairs[no_of_mrns > 1]
+    conflicts.append(d.assign(conflict='record has more than one MRN'))
+
+    # demo_uk_mrn_filled marks the rows where the MRN was forward filled
+    if ('demo_uk_mrn_filled' in d_redcap.columns):
+        all_filled = d_redcap.groupby('record_id', sort=False)[
+            'demo_uk_mrn_filled'].all()
+        filled_records = all_filled.index[all_filled.to_numpy()]
+        d = d_pairs[has_mrn & d_pairs['record_id'].isin(filled_records)]
+        conflicts.append(d.assign(
+            conflict='MRN forward filled from an earlier record'))
+
+    d_conflicts = pd.concat(conflicts, ignore_index=True)
+
+    return d_conflicts[conflict_columns]
+
+def return_registry_patients(registry):
+    """ Returns the record_id and first MRN for each record, in order """
+
+    # Code
+    return pd.DataFrame({'record_id': registry['record_ids'],
+                         'demo_uk_mrn': registry['record_mrns']})
+
+def match_registry_visits(registry, d_oncore, sample_events,
+                          match_window_days=10):
+    """ Matches each sample to the visit within match_window_days of its
+        collection date, looking the visits up in the registry. Where
+        more than one visit is in the window, the later event in
+        sample_events wins. Returns arrays of (patient_found, visit_type),
+        with None for unmatched samples """
+
+    # Code
+    patient_found = np.zeros(len(d_oncore), dtype=bool)
+    visit_types = np.full(len(d_oncore), None, dtype=object)
+
+    collection_dates = pd.DatetimeIndex(d_oncore['Collection Date'])
+
+    # Rows for each patient, found in one pass
+    patient_rows = d_oncore.groupby('Patient ID', sort=False).indices
+
+    for (mrn, mrn_visits) in registry['visits'].items():
+
+        rows = patient_rows.get(mrn)
+        if (rows is None):
+            continue
+
+        patient_found[rows] = True
+        dates = collection_dates[rows]
+
+        for sample_ev in sample_events:
+            if not (sample_ev in mrn_visits):
+                continue
+
+            # Days are NaN if either date is missing, so never match
+            days = (dates - mrn_visits[sample_ev]['visit_date']).days
+            matched = (np.abs(days.to_numpy(dtype=float)) <=
+                       match_window_days)
+            visit_types[rows[matched]] = sample_ev
+
+    return (patient_found, visit_types)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:00:25 2026
+"""
+
+import os
+import hashlib
+
+from datetime import date, datetime
+
+import pandas as pd
+
+# Columns stored for each run
+history_columns = ['record_id', 'demo_uk_mrn', 'sample_type', 'event',
+                   'status', 'n']
+
+
+def append_sample_history(d_long, history_folder, run_date=None):
+    """ Adds the long-format counts from a run to the history, a parquet
+        dataset with one run_date=YYYY-MM-DD folder per run date.
+        Files are named by a hash of their content, so re-running with the
+        same counts on the same day adds nothing. Returns the file string,
+        or None if these were already the latest counts for the day """
+
+    # Variables
+    if (run_date is None):
+        run_date = date.today()
+
+    # Code
+    d = d_long[history_columns].copy(deep=True)
+    d['record_id'] = d['record_id'].astype(str)
+    d['demo_uk_mrn'] = d['demo_uk_mrn'].astype(str)
+    d['n'] = d['n'].astype('int64')
+    d = d.sort_values(history_columns[:-1]).reset_index(drop=True)
+
+    # Hash the content
+    content_hash = hashlib.sha256(
+        d.to_csv(index=False).encode('utf-8')).hexdigest()[:16]
+
+    partition_folder = os.path.join(history_folder,
+                                    'run_date=%s' % run_date.isoformat())
+    history_file_string = os.path.join(partition_folder,
+                                       '%s.parquet' % content_hash)
+
+    if not (os.path.isdir(partition_folder)):
+        os.makedirs(partition_folder)
+
+    if (os.path.isfile(history_file_string)):
+        # Nothing to do unless a different run has been stored since
+        newest_file_string = max(
+            [os.path.join(partition_folder, f)
+             for f in os.listdir(partition_folder)],
+            key=os.path.getmtime)
+        if (newest_file_string == history_file_string):
+            print('Sample history already holds these counts: %s' %
+                  history_file_string)
+            return None
+
+    # Later runs on the same day supersede earlier ones in queries
+    d['run_time'] = datetime.now()
+
+    d.to_parquet(history_file_string, index=False)
+
+    print('Sample history written to: %s' % history_file_string)
+
+    return history_file_string
+
+def query_sample_history(history_folder, sample_types=None, events=None,
+                         statuses=None, start_date=None, end_date=None,
+                         group_by=['sample_type', 'event', 'status']):
+    """ Returns the total number of samples for each run date, summed over
+        patients and grouped by group_by. Only the run_date folders between
+        start_date and end_date, and only the needed columns, are read.
+        The other arguments restrict the sample types, events (e.g.
+        '0_months_arm_1') and statuses """
+
+    # Code
+
+    # Only imported when needed
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('run_date', pa.string())]),
+                                   flavor='hive')
+    dataset = ds.dataset(history_folder, format='parquet',
+                         partitioning=partitioning)
+
+    # Build the filters, the run_date terms prune whole folders
+    filters = []
+    if not (start_date is None):
+        filters.append(ds.field('run_date') >=
+                       pd.Timestamp(start_date).date().isoformat())
+    if not (end_date is None):
+        filters.append(ds.field('run_date') <=
+                       pd.Timestamp(end_date).date().isoformat())
+    date_filter = combine_filters(filters)
+
+    if not (sample_types is None):
+        filters.append(ds.field('sample_type').isin(sample_types))
+    if not (events is None):
+        filters.append(ds.field('event').isin(events))
+    if not (statuses is None):
+        filters.append(ds.field('status').isin(statuses))
+
+    row_filter = combine_filters(filters)
+
+    # Find the last run on each date before the other filters are applied
+    d_runs = dataset.to_table(columns=['run_date', 'run_time'],
+                              filter=date_filter).to_pandas()
+    last_runs = d_runs.groupby('run_date')['run_time'].max()
+
+    columns = ['run_date', 'run_time', 'n'] + \
+        [c for c in group_by if not (c in ['run_date', 'run_time', 'n'])]
+
+    d = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+    # Keep the last run on each date
+    d = d[d['run_time'] == d['run_date'].map(last_runs)]
+
+    d_trend = d.groupby(['run_date'] + list(group_by),
+                        as_index=False)['n'].sum()
+
+    return d_trend
+
+def combine_filters(filters):
+    """ Combines a list of dataset filters with and, None if empty """
+
+    # Code
+    combined = None
+    for f in filters:
+        if (combined is None):
+            combined = f
+        else:
+            combined = combined & f
+
+    return combined
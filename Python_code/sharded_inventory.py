@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 12:14:18 2026
+"""
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+from update_sample_inventory import deduce_sample_event
+from patient_registry import return_patient_registry
+
+
+def deduce_sample_event_sharded(d_redcap, d_oncore, no_of_processes=4,
+                                match_window_days=10):
+    """ Same as deduce_sample_event, but the patients are split into
+        no_of_processes shards by MRN and each shard is matched in its
+        own process. Returns d_oncore with the rows in the original order """
+
+    # Code
+
+    # Events are set for all shards so that ties are broken the same way
+    sample_events = return_patient_registry(d_redcap)['sample_events']
+    print(sample_events)
+
+    redcap_shards = return_mrn_shards(d_redcap['demo_uk_mrn'],
+                                      no_of_processes)
+    oncore_shards = return_mrn_shards(d_oncore['Patient ID'],
+                                      no_of_processes)
+
+    redcap_columns = ['record_id', 'demo_uk_mrn', 'redcap_event_name',
+                      'visit_date']
+    oncore_columns = ['Patient ID', 'Collection Date']
+
+    # Send the columns for each shard as Arrow buffers
+    jobs = []
+    for i in range(no_of_processes):
+        if (len(oncore_shards[i]) == 0):
+            continue
+        jobs.append((oncore_shards[i],
+                     (return_arrow_buffer(
+                         d_redcap[redcap_columns].iloc[redcap_shards[i]]),
+                      return_arrow_buffer(
+                         d_oncore[oncore_columns].iloc[oncore_shards[i]]),
+                      sample_events,
+                      match_window_days)))
+
+    results = run_shards(match_shard, jobs, no_of_processes)
+
+    # Put the shards back in order
+    d_oncore = d_oncore.copy()
+    d_oncore['REDCap_patient_found'] = False
+    d_oncore['REDCap_visit_type'] = 'Unmatched'
+
+    for (rows, d_match) in results:
+        d_oncore.iloc[rows, d_oncore.columns.get_loc('REDCap_patient_found')] = \
+            d_match['REDCap_patient_found'].to_numpy()
+        d_oncore.iloc[rows, d_oncore.columns.get_loc('REDCap_visit_type')] = \
+            d_match['REDCap_visit_type'].to_numpy()
+
+    return d_oncore
+
+def match_shard(redcap_buffer, oncore_buffer, sample_events,
+                match_window_days):
+    """ Runs in a worker process, matches one shard and returns the
+        found and visit type columns as an Arrow buffer """
+
+    # Code
+    d_redcap = return_arrow_frame(redcap_buffer)
+    d_oncore = return_arrow_frame(oncore_buffer)
+
+    d_oncore = deduce_sample_event(d_redcap, d_oncore,
+                                   match_window_days=match_window_days,
+                                   sample_events=sample_events)
+
+    return return_arrow_buffer(
+        d_oncore[['REDCap_patient_found', 'REDCap_visit_type']])
+
+def run_shards(function, jobs, no_of_processes):
+    """ Runs function on the arguments for each job in a process pool.
+        jobs is a list of (rows, arguments). Returns a list of
+        (rows, dataframe) in the same order """
+
+    # Code
+    with ProcessPoolExecutor(max_workers=no_of_processes) as executor:
+        futures = [executor.submit(function, *args) for (_, args) in jobs]
+        results = [(rows, return_arrow_frame(f.result()))
+                   for ((rows, _), f) in zip(jobs, futures)]
+
+    return results
+
+def return_mrn_shards(mrns, no_of_shards):
+    """ Splits rows by a hash of their MRN, so that a patient's rows in
+        REDCap and OnCore end up in the same shard. Returns a list of
+        arrays of row positions, in their original order """
+
+    # Code
+    hashes = pd.util.hash_pandas_object(mrns.astype(str), index=False)
+    shard_ids = hashes.to_numpy() % np.uint64(no_of_shards)
+
+    return [np.flatnonzero(shard_ids == i) for i in range(no_of_shards)]
+
+def return_arrow_buffer(d):
+    """ Returns a dataframe as an Arrow IPC buffer, which is sent to the
+        worker processes as one block of memory rather than pickled
+        row by row """
+
+    # Code
+
+    # Only imported when needed
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(d, preserve_index=False)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+def return_arrow_frame(buffer):
+    """ Reads a dataframe from an Arrow IPC buffer """
+
+    # Code
+
+    # Only imported when needed
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:49:46 2026
+"""
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def run_stage_graph(stages, artifacts=None, max_workers=4, timings=None):
+    """ Runs a list of stages, each of which is a dict with
+            'name' - a label for the stage
+            'function' - called with the input artifacts as arguments
+            'inputs' - list of artifact names passed to the function
+            'outputs' - artifact name for the return value, or None
+            'after' - optional list of artifact names that must exist
+                      before the stage starts but are not passed to it
+        Stages start as soon as all of their inputs are available, with
+        independent stages running concurrently in a thread pool.
+        If timings is a dict, it is filled with the seconds taken by each
+        stage. Returns a dict holding all of the artifacts """
+
+    # Variables
+    if (artifacts is None):
+        artifacts = dict()
+    else:
+        artifacts = dict(artifacts)
+
+    # Code
+
+    # Check the graph before starting anything
+    check_stage_graph(stages, artifacts)
+
+    pending = list(stages)
+    running = dict()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while (pending or running):
+
+            # Submit every stage whose inputs are ready
+            ready = [s for s in pending
+                     if all((i in artifacts) for i in return_stage_needs(s))]
+            for s in ready:
+                pending.remove(s)
+                args = [artifacts[i] for i in s['inputs']]
+                running[executor.submit(time_stage, s['function'], args)] = s
+
+            # Wait for something to finish
+            (done, _) = wait(running.keys(), return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                s = running.pop(fut)
+                # result() re-raises any exception from the stage
+                (result, seconds) = fut.result()
+                if not (timings is None):
+                    timings[s['name']] = seconds
+                if not (s['outputs'] is None):
+                    artifacts[s['outputs']] = result
+
+    # Return
+    return artifacts
+
+def time_stage(function, args):
+    """ Calls a stage function, returns the result and the seconds taken """
+
+    # Code
+    start = time.perf_counter()
+    result = function(*args)
+
+    return (result, time.perf_counter() - start)
+
+def check_stage_graph(stages, artifacts):
+    """ Makes sure that every input is produced by exactly one stage, or
+        supplied up front, and that the graph has no cycles """
+
+    # Code
+    produced = dict()
+    for s in stages:
+        out = s['outputs']
+        if (out is None):
+            continue
+        if ((out in produced) or (out in artifacts)):
+            raise ValueError('Artifact %s is produced more than once' % out)
+        produced[out] = s['name']
+
+    # Walk the stages in dependency order
+    available = set(artifacts)
+    remaining = list(stages)
+    while (remaining):
+        ready = [s for s in remaining
+                 if all((i in available) for i in return_stage_needs(s))]
+        if not (ready):
+            missing = sorted(set(i for s in remaining
+                                 for i in return_stage_needs(s)) - available)
+            raise ValueError('Stages %s cannot run, missing inputs %s' %
+                             ([s['name'] for s in remaining], missing))
+        for s in ready:
+            remaining.remove(s)
+            if not (s['outputs'] is None):
+                available.add(s['outputs'])
+
+def return_stage_needs(stage):
+    """ Returns the artifacts a stage waits for """
+
+    return stage['inputs'] + stage.get('after', [])
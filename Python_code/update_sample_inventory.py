@@ -16,11 +16,35 @@ import pandas as pd
 from datetime import date
 from dateutil.relativedelta import relativedelta
 
+from stage_graph import run_stage_graph
+from csv_ingest import read_csv_file
+from import_diff import return_previous_import, return_import_diff, \
+    write_import_diff
+from mrn_reconciliation import return_mrn_candidates
+from sample_history import append_sample_history
+from patient_registry import return_patient_registry, \
+    return_registry_patients, match_registry_visits
+from cohort_summary import return_cohort_summary
+from data_validation import validate_REDCap_data, validate_OnCore_data, \
+    return_validation_report, check_validation_report
+from data_dictionary import load_field_validators, return_import_text, \
+    validate_import_data
+
 # Code variables
 specimen_statuses = ['Available', 'Shipped']
 blood_sample_types = ['10^7 PBMC', 'Plasma', 'Whole Blood']
+adore_sample_types = ['10^7_PBMC', 'Plasma', 'Whole_Blood', 'Liver',
+                      'Stomach', 'Small_Intestine', 'Subcutaneous_fat',
+                      'Visceral_fat', 'Omental_fat']
+
+# File extensions for the intermediate artifacts, redcap_import.csv is
+# always written as plain csv
+output_file_extensions = {'csv': '.csv',
+                          'csv.gz': '.csv.gz',
+                          'parquet': '.parquet',
+                          'feather': '.feather'}
 
-def return_REDCap_data(redcap_file_string):
+def return_REDCap_data(redcap_file_string, csv_engine='c'):
     """ Code pulls data from REDCap via the API, restricts to needed columns,
         returns dataframe with participant information """
 
@@ -32,7 +56,8 @@ def return_REDCap_data(redcap_file_string):
     # Code
     
     # Load the file as a dataframe, keeping leading zeros on MRN
-    d = pd.read_csv(redcap_file_string, converters={'demo_uk_mrn': str})
+    d = read_csv_file(redcap_file_string, ['demo_uk_mrn'], csv_engine,
+                      usecols=columns_to_keep)
 
     # Restrict to needed columns
     d = d[columns_to_keep]
@@ -40,11 +65,18 @@ def return_REDCap_data(redcap_file_string):
     # Fill empty entries with NaN to then forward fill ukmrn
     d['demo_uk_mrn'] = d['demo_uk_mrn'].replace('', np.nan)
     
+    # Keep track of the filled rows, so conflicts can be found later
+    d['demo_uk_mrn_filled'] = d['demo_uk_mrn'].isnull()
+    
     # Forward fill the MRN
     d['demo_uk_mrn'] = d['demo_uk_mrn'].infer_objects(copy=False).ffill()
     
     # Convert mrn to string
-    d['demo_uk_mrn'] = d['demo_uk_mrn'].astype(str)
+    if (isinstance(d['demo_uk_mrn'].dtype, pd.StringDtype)):
+        # Arrow-backed, keep it that way
+        d['demo_uk_mrn'] = d['demo_uk_mrn'].fillna('nan')
+    else:
+        d['demo_uk_mrn'] = d['demo_uk_mrn'].astype(str)
     
     # Convert dates
     d = convert_series_to_datetimes(d)
@@ -52,7 +84,7 @@ def return_REDCap_data(redcap_file_string):
     # Return    
     return d
 
-def return_OnCore_data(oncore_file_string):
+def return_OnCore_data(oncore_file_string, csv_engine='c'):
     """ Loads full report from OnCore, restricts to needed columns,
         returns dataframe with inventory information """
     
@@ -63,11 +95,11 @@ def return_OnCore_data(oncore_file_string):
     # Code
     
     # Read in data, keeping leading zeros on MRN
-    d = pd.read_csv(oncore_file_string, converters={'Patient ID': str})
+    d = read_csv_file(oncore_file_string, ['Patient ID'], csv_engine,
+                      usecols=columns_to_keep)
      
-    # Tidy mrns
-    for i in range(len(d)):
-        d['Patient ID'].iat[i] = tidy_mrn(d['Patient ID'].iloc[i])
+    # Tidy mrns, padding them to 9 digits with leading zeros
+    d['Patient ID'] = d['Patient ID'].str.zfill(9)
  
     # Restrict to needed columns
     d = d[columns_to_keep]
@@ -105,94 +137,165 @@ def return_OnCore_data(oncore_file_string):
     # Return    
     return d
 
-def deduce_sample_event(d_redcap, d_oncore, output_folder,
-                        match_window_days=10):
-    """ Tries to match samples to a visit for each patient """
-   
-    # Find the unique patients in redcap
-    un_redcap_mrns = d_redcap['demo_uk_mrn'].unique()
+def validate_inventory_data(d_redcap, d_oncore, output_folder,
+                            fail_fast=False):
+    """ Checks both reports in one pass per table before matching, writes
+        validation_report.csv and, if fail_fast is set, stops the run
+        when a check with error severity fails """
     
-    # Find the event_names in redcap
-    all_event_names = d_redcap['redcap_event_name'].unique()
-    sample_events = [x for x in all_event_names if ('months' in x)]
+    # Code
+    checks = validate_REDCap_data(d_redcap) + \
+        validate_OnCore_data(d_oncore, d_redcap, specimen_statuses,
+                             adore_sample_types)
     
-    print(sample_events)
+    d_report = return_validation_report(checks)
     
-    # Add some columns to d_oncore
-    d_oncore['REDCap_patient_found'] = False
-    d_oncore['REDCap_visit_day_difference'] = None
-    d_oncore['REDCap_visit_type'] = None
-   
-    for (redcap_i, un_red_mrn) in enumerate(un_redcap_mrns):
-        
-        # Find the entries in d_oncore for the patient
-        vi_oncore = d_oncore.index[d_oncore['Patient ID'] == un_red_mrn].tolist()
-        
-        # Set the patient_found
-        d_oncore.loc[vi_oncore, 'REDCap_patient_found'] = True
-        
-        for (event_i, sample_ev) in enumerate(sample_events):
-            # Find the row for the patient visit
-            d_redcap_row = d_redcap[(d_redcap['demo_uk_mrn'] == un_red_mrn) &
-                         (d_redcap['redcap_event_name'] == sample_ev)]
-            
-            # If there is no match, continue
-            if (len(d_redcap_row) == 0):
-                continue            
-            
-            # Pull off the date
-            redcap_visit_date = d_redcap_row['visit_date'].iloc[0]
+    # Save it
+    report_file_string = os.path.join(output_folder, 'validation_report.csv')
+    d_report.to_csv(report_file_string, index=False)
+    
+    if (fail_fast):
+        check_validation_report(d_report)
+    
+    return (d_report)
 
-            # Set the day diff, and if appropriate assign to event
-            for ind in vi_oncore:
-                
-                d_oncore['REDCap_visit_day_difference'].iat[ind] = \
-                    (d_oncore['Collection Date'].iloc[ind] - redcap_visit_date).days
+def deduce_sample_event(d_redcap, d_oncore, output_folder=None,
+                        match_window_days=10, output_format='csv',
+                        sample_events=None):
+    """ Tries to match samples to a visit for each patient,
+        writes not_found and oncore_data if output_folder is set.
+        sample_events defaults to the months events in d_redcap """
+    
+    # Build the lookups
+    registry = return_patient_registry(d_redcap)
+    
+    d_oncore = match_sample_events(registry, d_oncore, match_window_days,
+                                   sample_events)
+    
+    # Save if required
+    if not (output_folder is None):
+        write_not_found_data(d_oncore, output_folder, output_format)
+        write_oncore_data(d_oncore, output_folder, output_format)
+    
+    return (d_oncore)
 
-                if (abs(d_oncore['REDCap_visit_day_difference'].iloc[ind]) <=
-                        match_window_days):
-                    # Assign
-                    d_oncore['REDCap_visit_type'].iat[ind] = sample_ev
+def match_sample_events(registry, d_oncore, match_window_days=10,
+                        sample_events=None):
+    """ Adds REDCap_patient_found and REDCap_visit_type to a copy of
+        d_oncore, using the visits in the patient registry. sample_events
+        defaults to the events in the registry """
+    
+    # Find the event_names in redcap
+    if (sample_events is None):
+        sample_events = registry['sample_events']
+        print(sample_events)
+    
+    (patient_found, visit_types) = match_registry_visits(
+        registry, d_oncore, sample_events, match_window_days)
     
     # Set status for unmatched
-    vi_unmatched = d_oncore.index[d_oncore['REDCap_visit_type'].isnull()].tolist()
-    d_oncore.loc[vi_unmatched, 'REDCap_visit_type'] = 'Unmatched'
+    visit_types[pd.isnull(visit_types)] = 'Unmatched'
     
-    # Drop unnecessary column
-    d_oncore = d_oncore.drop(['REDCap_visit_day_difference'], axis=1)
+    d_oncore = d_oncore.copy()
+    d_oncore['REDCap_patient_found'] = patient_found
+    d_oncore['REDCap_visit_type'] = visit_types
+    
+    return (d_oncore)
+
+def return_sample_types(d_oncore):
+    """ Returns the ADORE sample types, in the order they appear """
+    
+    # Code
+    sample_types = d_oncore['ADORE sample type'].unique()
+    
+    # Drop the empty one
+    return [x for x in sample_types if not (x=='')]
+
+def write_registry_conflicts(registry, output_folder, output_format='csv'):
+    """ Writes the MRNs and records that do not map one to one """
+    
+    # Code
+    d_conflicts = registry['d_conflicts']
+    if not (d_conflicts.empty):
+        print('Patient registry: %i MRN conflicts' % len(d_conflicts))
+    
+    write_table(d_conflicts, output_folder, 'registry_conflicts',
+                output_format)
+
+def write_not_found_data(d_oncore, output_folder, output_format='csv'):
+    """ Writes the samples from patients that are not in REDCap """
     
     # Create a dataframe with the patients that haven't been found
     d_not_found = d_oncore[d_oncore['REDCap_patient_found'] == False]
     # Save it
-    not_found_file_string = os.path.join(output_folder, 'not_found.csv')
-    d_not_found.to_csv(not_found_file_string, index=False)
-                      
-    # Save the main dataframe
-    oncore_file_string = os.path.join(output_folder, 'oncore_data.csv')
-    d_oncore.to_csv(oncore_file_string, index=False)
+    write_table(d_not_found, output_folder, 'not_found', output_format)
+
+def write_oncore_data(d_oncore, output_folder, output_format='csv'):
+    """ Writes the matched OnCore data """
     
-    return (d_oncore)
+    # Save the main dataframe
+    write_table(d_oncore, output_folder, 'oncore_data', output_format)
 
-def count_patient_samples(d_redcap, d_oncore, output_folder):
-    """ Count the samples of each type for each patient """
+def write_mrn_candidates(d_candidates, output_folder, output_format='csv'):
+    """ Writes the candidate REDCap MRNs for the patients in not_found """
     
-    # Find the unique record_ids
-    un_record_ids = d_redcap['record_id'].unique()
+    # Save it next to not_found
+    write_table(d_candidates, output_folder, 'not_found_candidates',
+                output_format)
+
+def count_patient_samples(d_redcap, d_oncore, output_folder=None,
+                          output_format='csv', sample_events=None,
+                          sample_types=None):
+    """ Count the samples of each type for each patient, writes
+        sample_counts and redcap_import.csv if output_folder is set.
+        sample_events and sample_types set the columns, and default to
+        the values in d_redcap and d_oncore """
+    
+    # Count the samples that are there, then spread them out
+    registry = return_patient_registry(d_redcap)
+    d_long = return_long_sample_counts(registry, d_oncore)
+    
+    d_counts = return_wide_sample_counts(d_long, registry, d_oncore,
+                                         sample_events, sample_types)
+    
+    # Save if required
+    if not (output_folder is None):
+        write_sample_counts(d_counts, output_folder, output_format)
+        write_redcap_import(return_redcap_import(d_counts), output_folder)
+    
+    return (d_counts)
+
+def return_wide_sample_counts(d_long, registry, d_oncore, sample_events=None,
+                              sample_types=None):
+    """ Returns the wide sample counts, one column for every type, event
+        and status and one row for every record in the registry, from the
+        long counts """
     
     # Find the event_names in redcap
-    all_event_names = d_redcap['redcap_event_name'].unique()
-    sample_events = [x for x in all_event_names if ('months' in x)]
+    if (sample_events is None):
+        sample_events = registry['sample_events']
     
     # Add in unmatched
-    sample_events.append('Unmatched')
+    sample_events = sample_events + ['Unmatched']
     
     # Get the sample types
-    sample_types = d_oncore['ADORE sample type'].unique()
-    # Drop the empty one
-    sample_types = [x for x in sample_types if not (x=='')]
+    if (sample_types is None):
+        sample_types = return_sample_types(d_oncore)
+    
+    return pivot_sample_counts(d_long, return_registry_patients(registry),
+                               sample_types, sample_events)
+
+def pivot_sample_counts(d_long, d_patients, sample_types, sample_events,
+                        statuses=specimen_statuses):
+    """ Pivots the long counts to the layout of sample_counts, with a row
+        for each record in d_patients and a column for each type, event
+        and status, filled with 0 where there are no samples. Subsets of
+        the patients, types, events or statuses give a subset of the
+        table. sample_events should include Unmatched if it is wanted """
     
     # Set the col names
-    col_names = ['record_id', 'demo_uk_mrn']
+    col_names = []
+    col_keys = []
     for ty in sample_types:
         for se in sample_events:
             
@@ -201,64 +304,95 @@ def count_patient_samples(d_redcap, d_oncore, output_folder):
                 (not (se in ['0_months_arm_1', 'Unmatched']))):
                 continue
             
-            for st in specimen_statuses:
-                # Work out the event string
-                under_ind = [i for i, c in enumerate(se) if (c == '_')]
-                if (len(under_ind) > 1):
-                    se_string = se[0:under_ind[-2]]
-                else:
-                    se_string = se
-                
-                col_names.append('%s_%s_%s' % (ty, se_string, st))
-       
-    # Make a database
-    d_counts = pd.DataFrame(columns=col_names, index=range(len(un_record_ids)))
-    
-    # Loop through patients counting the samples
-    for pat_i in range(len(un_record_ids)):
-        d_counts['record_id'].iat[pat_i] = un_record_ids[pat_i]
-        
-        # pull out the patient so we can work out the mrn
-        d_pat = d_redcap[d_redcap['record_id'] == un_record_ids[pat_i]]
-        # Set the mrn
-        uk_mrn = d_pat['demo_uk_mrn'].iloc[0]
-        d_counts['demo_uk_mrn'].iat[pat_i] = uk_mrn
-        
-        # Now cycle through the type / event / status combination
-        for ty in sample_types:
-            for se in sample_events:
-                
-                # Check for sample types that can only be at 0 months or unmatched
-                if ((not (ty in blood_sample_types)) and
-                    (not (se in ['0_months_arm_1', 'Unmatched']))):
-                    continue
-                
-                for st in specimen_statuses:
-
-                    d_match = d_oncore[(d_oncore['Patient ID'] == uk_mrn) &
-                                       (d_oncore['ADORE sample type'] == ty) &
-                                       (d_oncore['REDCap_visit_type'] == se) &
-                                       (d_oncore['Specimen Status'] == st)].copy(deep=True)
-
-                    if (d_match.empty):
-                        no_of_samples = 0
-                    else:
-                        no_of_samples = len(d_match)
-                                                
-                    # Work out the event string
-                    under_ind = [i for i, c in enumerate(se) if (c == '_')]
-                    if (len(under_ind) > 1):
-                        se_string = se[0:under_ind[-2]]
-                    else:
-                        se_string = se
-                    col_name = '%s_%s_%s' % (ty, se_string, st)
-                    
-                    # Store it
-                    d_counts[col_name].iat[pat_i] = no_of_samples
+            for st in statuses:
+                col_names.append(return_count_column_name(ty, se, st))
+                col_keys.append((ty, se, st))
+    
+    # Name the column for each count
+    key_names = dict(zip(col_keys, col_names))
+    keys = zip(d_long['sample_type'], d_long['event'], d_long['status'])
+    d = pd.DataFrame({'record_id': d_long['record_id'].to_numpy(),
+                      'column': [key_names.get(k) for k in keys],
+                      'n': d_long['n'].to_numpy()})
+    d = d[d['column'].notnull()]
+    
+    # Spread them out
+    d_wide = d.set_index(['record_id', 'column'])['n'].unstack(fill_value=0)
+    d_wide = d_wide.reindex(index=d_patients['record_id'].to_numpy(),
+                            columns=col_names, fill_value=0)
+    
+    d_counts = pd.DataFrame(
+        {'record_id': d_patients['record_id'].to_numpy(),
+         'demo_uk_mrn': d_patients['demo_uk_mrn'].to_numpy()})
+    d_counts = pd.concat([d_counts, d_wide.reset_index(drop=True)], axis=1)
+    
+    # Same types as the table that was filled cell by cell
+    return d_counts.astype(object)
+
+def return_count_column_name(sample_type, sample_event, status):
+    """ Returns the sample_counts column, e.g. Plasma_3_months_Available """
+    
+    # Work out the event string
+    under_ind = [i for i, c in enumerate(sample_event) if (c == '_')]
+    if (len(under_ind) > 1):
+        se_string = sample_event[0:under_ind[-2]]
+    else:
+        se_string = sample_event
+    
+    return '%s_%s_%s' % (sample_type, se_string, status)
+
+def return_long_sample_counts(registry, d_oncore):
+    """ Counts the samples for each patient, type, event and status in
+        long format, keeping only the combinations with samples and
+        following the same rules as count_patient_samples """
+    
+    # Code
+    
+    # Samples that are counted
+    d = d_oncore[(d_oncore['ADORE sample type'] != '') &
+                 (d_oncore['Specimen Status'].isin(specimen_statuses))]
+    
+    # Sample types that can only be at 0 months or unmatched
+    d = d[d['ADORE sample type'].isin(blood_sample_types) |
+          d['REDCap_visit_type'].isin(['0_months_arm_1', 'Unmatched'])]
+    
+    d_n = d.groupby(['Patient ID', 'ADORE sample type', 'REDCap_visit_type',
+                     'Specimen Status']).size().reset_index(name='n')
+    d_n.columns = ['demo_uk_mrn', 'sample_type', 'event', 'status', 'n']
+    
+    # Map to records, using the first MRN for each record
+    d_long = pd.merge(return_registry_patients(registry), d_n,
+                      on='demo_uk_mrn', how='inner')
+    
+    return (d_long)
+
+def write_long_sample_counts(d_long, output_folder, output_format='csv'):
+    """ Writes the long counts, one row for each record, type, event and
+        status with samples """
+    
+    # Code
+    write_table(d_long, output_folder, 'sample_counts_long', output_format)
+
+def write_cohort_summary(cohort, output_folder, output_format='csv'):
+    """ Writes the cohort totals and the availability flags for each
+        patient, cohort is returned by return_cohort_summary """
+    
+    # Code
+    (d_summary, d_availability) = cohort
+    
+    write_table(d_summary, output_folder, 'cohort_summary', output_format)
+    write_table(d_availability, output_folder, 'patient_availability',
+                output_format)
+
+def write_sample_counts(d_counts, output_folder, output_format='csv'):
+    """ Writes the sample counts for each patient """
     
     # Save to folder
-    counts_file_string = os.path.join(output_folder, 'sample_counts.csv')
-    d_counts.to_csv(counts_file_string, index=False)
+    write_table(d_counts, output_folder, 'sample_counts', output_format)
+
+def return_redcap_import(d_counts):
+    """ Converts the sample counts to a dataframe matching the
+        REDCap import fields """
 
     # Convert to import file
     d_import = d_counts.copy(deep=True)
@@ -291,65 +425,269 @@ def count_patient_samples(d_redcap, d_oncore, output_folder):
         
         d_import.rename(columns={col: col_string}, inplace=True)
 
+    return (d_import)
+
+def validate_redcap_import(d_import, validators, output_folder,
+                           fail_fast=False):
+    """ Checks the import against the REDCap data dictionary before it is
+        written, writes import_validation_report.csv and, if fail_fast is
+        set, stops the run when a check with error severity fails """
+    
+    # Code
+    d_report = return_validation_report(
+        validate_import_data(return_import_text(d_import), validators))
+    
+    # Save it
+    report_file_string = os.path.join(output_folder,
+                                      'import_validation_report.csv')
+    d_report.to_csv(report_file_string, index=False)
+    
+    if (fail_fast):
+        check_validation_report(d_report)
+    
+    return (d_report)
+
+def write_redcap_import(d_import, output_folder):
+    """ Writes the file that is uploaded to REDCap """
+
     # Create the import file
     import_file_string = os.path.join(output_folder, 'redcap_import.csv')        
     d_import.to_csv(import_file_string, index=False)
+
+def write_table(d, output_folder, file_stem, output_format='csv'):
+    """ Writes an intermediate artifact as csv, gzipped csv, parquet
+        or feather, returns the file string """
+    
+    # Code
+    if not (output_format in output_file_extensions):
+        raise ValueError('Unknown output format: %s' % output_format)
+    
+    file_string = os.path.join(output_folder,
+                               file_stem + output_file_extensions[output_format])
+    
+    if (output_format in ['csv', 'csv.gz']):
+        # Compression is inferred from the extension
+        d.to_csv(file_string, index=False)
+    elif (output_format == 'parquet'):
+        d.to_parquet(file_string, index=False)
+    elif (output_format == 'feather'):
+        # Feather only stores a default index
+        d.reset_index(drop=True).to_feather(file_string)
+    
+    return file_string
+
+def read_table(file_string):
+    """ Reads an artifact written by write_table back into a dataframe,
+        keeping leading zeros on MRNs in the csv formats """
+    
+    # Code
+    if (file_string.endswith('.parquet')):
+        d = pd.read_parquet(file_string)
+    elif (file_string.endswith('.feather')):
+        d = pd.read_feather(file_string)
+    else:
+        d = pd.read_csv(file_string,
+                        dtype={'Patient ID': str, 'demo_uk_mrn': str})
+        d = convert_series_to_datetimes(d)
+    
+    return d
         
 def convert_series_to_datetimes(d):
-    """ Find columns with the word 'date', convert to Datetime """
+    """ Find columns with the word 'date', convert to Datetime. Dates
+        that cannot be read become NaT, so that validation reports them
+        rather than the load stopping """
     
     # Code
     cols = d.columns
     
     for (i,c) in enumerate(cols):
         if ('date' in c.lower()):
-            d[c] = pd.to_datetime(d[c])
+            d[c] = pd.to_datetime(d[c], errors='coerce')
     
     return d
 
-def tidy_mrn(mrn_string):
-    """ Tidies mrn """
-   
-    n = len(mrn_string)
-    
-    while (n < 9):
-        mrn_string = '0%s' % mrn_string
-        n = len(mrn_string)
-        
-    return mrn_string
-
-############################################################################
-if __name__ == "__main__":
-    
-    # Parse variables
-    redcap_data_file_string = sys.argv[1]
-    oncore_report_file_string = sys.argv[2]
-    output_folder = sys.argv[3]
-    
-    # display
-    print('REDCap data file: %s' % redcap_data_file_string)
-    print('OnCore data file: %s' % oncore_report_file_string)
-    print('Output folder: %s' % output_folder)
+def update_sample_inventory(redcap_data_file_string,
+                            oncore_report_file_string,
+                            output_folder,
+                            previous_import_file_string=None,
+                            output_format='csv',
+                            csv_engine='c',
+                            fail_fast=False,
+                            history_folder=None,
+                            max_workers=4,
+                            timings=None,
+                            no_of_processes=None,
+                            data_dictionary_file_string=None):
+    """ Runs the full update as a graph of stages. The loaders run
+        concurrently, as do the writers once their inputs are ready.
+        If previous_import_file_string is set, the new counts are compared
+        to it and only the changes are written to redcap_import_diff.csv.
+        output_format sets the format of not_found, oncore_data,
+        sample_counts, sample_counts_long and the cohort summary tables.
+        csv_engine 'pyarrow' reads the inputs with Arrow's
+        multithreaded parser. fail_fast stops the run before matching if
+        validation finds errors. If history_folder is set, the counts are
+        added to the longitudinal history there. timings is passed to
+        run_stage_graph. If no_of_processes is set, matching is split
+        by MRN across that many processes. If data_dictionary_file_string
+        is set, the import is checked against the REDCap data dictionary
+        before it is written """
     
     # Make sure the output folder exists
     if not (os.path.isdir(output_folder)):
         os.makedirs(output_folder)
     
-    # Pull the data from REDCap via the API    
-    d_redcap = return_REDCap_data(redcap_data_file_string)
-    
-    print(d_redcap)
+    # Build the stages
+    stages = [
+        {'name': 'load_redcap',
+         'function': return_REDCap_data,
+         'inputs': ['redcap_file', 'csv_engine'],
+         'outputs': 'd_redcap'},
+        {'name': 'load_oncore',
+         'function': return_OnCore_data,
+         'inputs': ['oncore_file', 'csv_engine'],
+         'outputs': 'd_oncore_raw'},
+        {'name': 'validate',
+         'function': validate_inventory_data,
+         'inputs': ['d_redcap', 'd_oncore_raw', 'output_folder', 'fail_fast'],
+         'outputs': 'd_validation'},
+        {'name': 'registry',
+         'function': return_patient_registry,
+         'inputs': ['d_redcap'],
+         'outputs': 'registry'},
+        {'name': 'match',
+         'function': match_sample_events,
+         'inputs': ['registry', 'd_oncore_raw'],
+         'outputs': 'd_oncore',
+         'after': ['d_validation']},
+        {'name': 'long_counts',
+         'function': return_long_sample_counts,
+         'inputs': ['registry', 'd_oncore'],
+         'outputs': 'd_long_counts'},
+        {'name': 'count',
+         'function': return_wide_sample_counts,
+         'inputs': ['d_long_counts', 'registry', 'd_oncore'],
+         'outputs': 'd_counts'},
+        {'name': 'import',
+         'function': return_redcap_import,
+         'inputs': ['d_counts'],
+         'outputs': 'd_import'},
+        {'name': 'write_registry_conflicts',
+         'function': write_registry_conflicts,
+         'inputs': ['registry', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'write_not_found',
+         'function': write_not_found_data,
+         'inputs': ['d_oncore', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'write_oncore',
+         'function': write_oncore_data,
+         'inputs': ['d_oncore', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'reconcile',
+         'function': return_mrn_candidates,
+         'inputs': ['d_redcap', 'd_oncore'],
+         'outputs': 'd_mrn_candidates'},
+        {'name': 'write_mrn_candidates',
+         'function': write_mrn_candidates,
+         'inputs': ['d_mrn_candidates', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'write_long_counts',
+         'function': write_long_sample_counts,
+         'inputs': ['d_long_counts', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'cohort',
+         'function': return_cohort_summary,
+         'inputs': ['registry', 'd_oncore'],
+         'outputs': 'cohort_summary'},
+        {'name': 'write_cohort',
+         'function': write_cohort_summary,
+         'inputs': ['cohort_summary', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'write_counts',
+         'function': write_sample_counts,
+         'inputs': ['d_counts', 'output_folder', 'output_format'],
+         'outputs': None},
+        {'name': 'write_import',
+         'function': write_redcap_import,
+         'inputs': ['d_import', 'output_folder'],
+         'outputs': None}]
+    
+    # Swap in the sharded matching if required. Counting stays in this
+    # process, it is one groupby and a pivot of the long counts
+    if not (no_of_processes is None):
+        # Imported here as it imports from this file
+        from sharded_inventory import deduce_sample_event_sharded
+        
+        for s in stages:
+            if (s['name'] == 'match'):
+                s['function'] = deduce_sample_event_sharded
+                s['inputs'] = ['d_redcap', 'd_oncore_raw', 'no_of_processes']
+    
+    artifacts = {'redcap_file': redcap_data_file_string,
+                 'oncore_file': oncore_report_file_string,
+                 'output_folder': output_folder,
+                 'output_format': output_format,
+                 'csv_engine': csv_engine,
+                 'fail_fast': fail_fast,
+                 'no_of_processes': no_of_processes}
+    
+    # Add the diff stages if required
+    if not (previous_import_file_string is None):
+        stages = stages + [
+            {'name': 'load_previous',
+             'function': return_previous_import,
+             'inputs': ['previous_import_file'],
+             'outputs': 'd_previous'},
+            {'name': 'diff',
+             'function': return_import_diff,
+             'inputs': ['d_import', 'd_previous'],
+             'outputs': 'd_import_diff'},
+            {'name': 'write_diff',
+             'function': write_import_diff,
+             'inputs': ['d_import_diff', 'output_folder'],
+             'outputs': None}]
+        artifacts['previous_import_file'] = previous_import_file_string
+    
+    # Check the import before writing it if required
+    if not (data_dictionary_file_string is None):
+        stages = stages + [
+            {'name': 'load_dictionary',
+             'function': load_field_validators,
+             'inputs': ['data_dictionary_file'],
+             'outputs': 'validators'},
+            {'name': 'validate_import',
+             'function': validate_redcap_import,
+             'inputs': ['d_import', 'validators', 'output_folder',
+                        'fail_fast'],
+             'outputs': 'd_import_validation'}]
+        # Neither import file is written until the checks pass
+        for s in stages:
+            if (s['name'] in ['write_import', 'write_diff']):
+                s['after'] = ['d_import_validation']
+        artifacts['data_dictionary_file'] = data_dictionary_file_string
+    
+    # Add the history stages if required
+    if not (history_folder is None):
+        stages = stages + [
+            {'name': 'history',
+             'function': append_sample_history,
+             'inputs': ['d_long_counts', 'history_folder'],
+             'outputs': None}]
+        artifacts['history_folder'] = history_folder
+    
+    # Run
+    artifacts = run_stage_graph(stages, artifacts, max_workers=max_workers,
+                                timings=timings)
+    
+    print(artifacts['d_redcap'])
+    print(artifacts['d_oncore'])
+    
+    return (artifacts)
 
-    # And load the data from OnCore
-    d_oncore = return_OnCore_data(oncore_report_file_string)
-    
-    print(d_oncore)
-    
-    # Match the sample collection dates to redcap entries    
-    d_oncore = deduce_sample_event(d_redcap, d_oncore, output_folder)
-    
-    # Count patient samples for each category
-    d_redcap = count_patient_samples(d_redcap, d_oncore, output_folder)
+############################################################################
+if __name__ == "__main__":
     
-   
-    
\ No newline at end of file
+    # Same as adore.py inventory
+    from adore import main
+    sys.exit(main(['inventory'] + sys.argv[1:]))